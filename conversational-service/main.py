@@ -1,22 +1,77 @@
 import os
+import re
+import asyncio
+import socket
+import time
+import datetime
+import httpx
+import numpy as np
 import uvicorn
 import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel, Field
-from openai import OpenAI
-from sqlalchemy.orm import Session, joinedload
+from openai import AsyncOpenAI
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import List, Literal
 
-from utils.db import get_db, Avatar, User, Session as DbSession, Interaction, UserMemory, AvatarMemory
+from utils.db import get_db, AsyncSessionLocal, Avatar, Session as DbSession, Interaction, Memory, UserMemory, AvatarMemory, MemoryExtractionJob
+from utils.http import get_http_client, close_http_client, get_http_stats, TIMEOUT_PROFILES
 
 LLM_HOST = os.getenv("LLM_HOST", "https://api.openai.com/v1")
-LLM_API_KEY = os.getenv("LLM_API_KEY")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+VOCAL_SERVICE_URL = os.getenv("VOCAL_SERVICE_URL")
+SENTENCE_PIPELINING = os.getenv("SENTENCE_PIPELINING", "true").lower() == "true"
+SENTENCE_MIN_CHARS = int(os.getenv("SENTENCE_MIN_CHARS", "40")) # shorter sentences are merged with the next one
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50")) # per LLM client
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120")) # seconds
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5")) # seconds
+
+# Rolling history window: recent turns are sent verbatim, older ones are folded into Session.history_summary
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6")) # turns kept verbatim
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "4")) # older turns folded into the summary per LLM call
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000")) # approximate tokens for summary + verbatim turns
+CHARS_PER_TOKEN = 4 # rough estimate, avoids a tokenizer dependency
+
+# Only the memories most relevant to the current input are added to the prompt
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "8")) # per user and per avatar
+
+# Opt-in per avatar: near-identical questions reuse an earlier content answer
+CONTENT_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CONTENT_CACHE_SIMILARITY_THRESHOLD", "0.95")) # cosine similarity
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", "86400")) # seconds
+CONTENT_CACHE_MAX_ENTRIES = int(os.getenv("CONTENT_CACHE_MAX_ENTRIES", "1000")) # per avatar, least recently used are evicted
+
+# Memory extraction runs after the response is returned, from the memory_extraction_job queue
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "2"))
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "10")) # turns claimed per batch
+MEMORY_POLL_INTERVAL = float(os.getenv("MEMORY_POLL_INTERVAL", "5")) # seconds, lets turns accumulate into batches
+MEMORY_JOB_LEASE_TIMEOUT = int(os.getenv("MEMORY_JOB_LEASE_TIMEOUT", "300")) # seconds before a running job is reclaimed
+MEMORY_JOB_MAX_ATTEMPTS = int(os.getenv("MEMORY_JOB_MAX_ATTEMPTS", "3"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_client()
+    workers = [asyncio.create_task(memory_worker(f"{socket.gethostname()}-{os.getpid()}-{i}")) for i in range(MEMORY_WORKERS)]
+    logger.info(f"Started {len(workers)} memory extraction workers.")
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, *summary_tasks, return_exceptions=True)
+    await close_openai_clients()
+    await close_http_client()
 
 app = FastAPI(
     title="Conversational Engine",
     description="Generates persona-aligned text responses based on an interaction ID.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -39,25 +94,320 @@ class MemoryItem(BaseModel):
 class MemoryExtractionTool(BaseModel):
     memories: List[MemoryItem]
 
-# --- Helper Function for API Client ---
-def get_openai_client(provider_endpoint: str, api_key_env_var: str | None) -> OpenAI:
+class FusedResponseTool(BaseModel):
+    raw_content_response: str = Field(..., description="The factual answer, without any persona styling.")
+    final_response_text: str = Field(..., description="The same answer rephrased according to the persona, as spoken text.")
+
+# --- Sentence Pipelining ---
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+")
+
+class SentenceSplitter:
+    """Accumulates streamed text and returns sentences as soon as they are complete."""
+    def __init__(self, min_chars: int = SENTENCE_MIN_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self.buffer += text
+        parts = SENTENCE_BOUNDARY.split(self.buffer)
+        # The last part may still be growing
+        self.buffer = parts.pop()
+        sentences, pending = [], ""
+        for part in parts:
+            pending = f"{pending} {part}" if pending else part
+            if len(pending) >= self.min_chars:
+                sentences.append(pending)
+                pending = ""
+        if pending:
+            self.buffer = f"{pending} {self.buffer}"
+        return sentences
+
+    def flush(self) -> list[str]:
+        sentence, self.buffer = self.buffer.strip(), ""
+        return [sentence] if sentence else []
+
+async def synthesize_segment(interaction_id: int, segment_index: int, text: str):
+    """Hands one finished sentence to the vocal service, which synthesizes it while the LLM keeps generating."""
+    try:
+        client = get_http_client()
+        response = await client.post(
+            f"{VOCAL_SERVICE_URL}/v1/synthesize-segment",
+            json={"interaction_id": interaction_id, "segment_index": segment_index, "text": text},
+            timeout=TIMEOUT_PROFILES["default"]
+        )
+        response.raise_for_status()
+    except Exception as e:
+        # Not fatal: the vocal service falls back to synthesizing the full text
+        logger.warning(f"Segment {segment_index} of interaction {interaction_id} could not be synthesized: {e}")
+
+# --- Conversation History ---
+summary_tasks: set[asyncio.Task] = set()
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def turn_messages(turn: Interaction) -> list[dict]:
+    return [{"role": role, "content": content} for role, content in [("user", turn.user_input_text), ("assistant", turn.agent_response_text)] if content]
+
+def build_history_messages(session: DbSession, turns: list[Interaction]) -> list[dict]:
+    """
+    Builds the history sent to the LLMs from the session summary and the turns
+    not yet summarized, dropping the oldest turns that exceed the token budget.
+    """
+    budget = HISTORY_TOKEN_BUDGET
+    summary_messages = []
+    if session.history_summary:
+        summary_messages.append({"role": "system", "content": f"Summary of the earlier conversation: {session.history_summary}"})
+        budget -= estimate_tokens(session.history_summary)
+
+    recent_messages = []
+    for turn in reversed(turns):
+        messages = turn_messages(turn)
+        tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        if tokens > budget:
+            break
+        budget -= tokens
+        recent_messages[:0] = messages
+    return summary_messages + recent_messages
+
+def construct_summary_prompt(previous_summary: str | None, turns: list[tuple[str, str]]) -> str:
+    conversation = "\n".join(f"User: {user_input}\nAvatar: {avatar_response}" for user_input, avatar_response in turns)
+    return (
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New conversation turns:\n{conversation}\n\n"
+        "Update the summary so it also covers the new turns. Keep facts, open questions and commitments, "
+        "drop small talk, and answer with the updated summary only, in at most a few short paragraphs."
+    )
+
+async def fold_history(session_id: int, previous_cutoff: int | None, previous_summary: str | None, turns: list[tuple[int, str, str]]):
+    """Folds turns that left the verbatim window into the session summary, so each turn is summarized only once."""
+    try:
+        memory_client = get_openai_client(LLM_HOST, "LLM_API_KEY")
+        response = await memory_client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": "You maintain a running summary of a conversation between a user and an avatar."},
+                {"role": "user", "content": construct_summary_prompt(previous_summary, [(user_input, avatar_response) for _, user_input, avatar_response in turns])}
+            ]
+        )
+        new_summary = response.choices[0].message.content.strip()
+
+        async with AsyncSessionLocal() as db:
+            # Only advance from the cutoff the summary was based on, in case another request folded first
+            result = await db.execute(
+                update(DbSession).where(
+                    DbSession.session_id == session_id, func.coalesce(DbSession.summarized_interaction_id, 0) == (previous_cutoff or 0)
+                ).values(history_summary=new_summary, summarized_interaction_id=turns[-1][0])
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info(f"Folded {len(turns)} turns into the summary of session {session_id}.")
+    except Exception as e:
+        logger.error(f"Failed to update history summary of session {session_id}: {e}")
+
+def schedule_history_fold(session: DbSession, turns: list[Interaction]):
+    """Starts folding the oldest turns once enough of them have left the verbatim window."""
+    overflow = turns[:-HISTORY_MAX_TURNS] if HISTORY_MAX_TURNS else turns
+    if len(overflow) < HISTORY_SUMMARY_BATCH:
+        return
+    task = asyncio.create_task(fold_history(
+        session.session_id, session.summarized_interaction_id, session.history_summary,
+        [(turn.interaction_id, turn.user_input_text or "", turn.agent_response_text or "") for turn in overflow]
+    ))
+    summary_tasks.add(task)
+    task.add_done_callback(summary_tasks.discard)
+
+# --- Memory Retrieval ---
+def memory_text(memory_key: str, memory_value: str | None) -> str:
+    return f"{memory_key}: {memory_value or ''}"
+
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    embedding_client = get_openai_client(LLM_HOST, "LLM_API_KEY")
+    response = await embedding_client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [item.embedding for item in response.data]
+
+async def retrieve_memories(memories: list[Memory], query_embedding: list[float] | None) -> list[Memory]:
+    """
+    Returns the MEMORY_TOP_K memories most similar to the query embedding.
+    Memories stored before embeddings existed are embedded once and saved.
+    Without a query embedding, or with too few embedded memories to rank, the
+    most recently updated memories are used.
+    """
+    if len(memories) <= MEMORY_TOP_K:
+        return memories
+    most_recent = sorted(memories, key=lambda m: m.last_updated or datetime.datetime.min, reverse=True)[:MEMORY_TOP_K]
+    if query_embedding is None:
+        return most_recent
+
+    missing = [memory for memory in memories if not memory.embedding]
+    if missing:
+        try:
+            embeddings = await embed_texts([memory_text(m.memory_key, m.memory_value) for m in missing])
+            # Saved in a separate session, so a failure never rolls back (and expires) the request's objects
+            async with AsyncSessionLocal() as backfill_db:
+                for memory, embedding in zip(missing, embeddings):
+                    await backfill_db.execute(update(Memory).where(Memory.memory_id == memory.memory_id).values(embedding=embedding))
+                await backfill_db.commit()
+            for memory, embedding in zip(missing, embeddings):
+                set_committed_value(memory, "embedding", embedding)
+        except Exception as e:
+            logger.warning(f"Could not embed {len(missing)} stored memories: {e}")
+    embedded = [memory for memory in memories if memory.embedding]
+    if len(embedded) < MEMORY_TOP_K:
+        return most_recent
+
+    try:
+        # Cosine similarity between the query and every memory
+        matrix = np.array([memory.embedding for memory in embedded], dtype=np.float32)
+        query = np.array(query_embedding, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-8)
+        return [embedded[i] for i in np.argsort(-scores)[:MEMORY_TOP_K]]
+    except Exception as e:
+        logger.warning(f"Could not rank {len(embedded)} memories by relevance, using most recent: {e}")
+        return most_recent
+
+# --- Content Cache ---
+class ContentCache:
+    """
+    In-process LRU cache of content responses per avatar. A question matches an
+    entry if its normalized text is identical, or if its embedding is at least
+    CONTENT_CACHE_SIMILARITY_THRESHOLD similar to the entry's. Entries are shared
+    across users, so only responses to prompts without user context belong here.
+    """
+    def __init__(self, max_entries: int, ttl: int, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries: dict[int, OrderedDict[str, tuple[np.ndarray | None, str, float]]] = {}
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self.best_miss_similarities: list[float] = [] # recent near misses, to help tune the threshold
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        return re.sub(r"[^\w\s]", "", " ".join(prompt.lower().split()))
+
+    @staticmethod
+    def unit(embedding: list[float] | None) -> np.ndarray | None:
+        if embedding is None:
+            return None
+        vector = np.array(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-8)
+
+    def get(self, avatar_id: int, prompt: str, embedding: list[float] | None) -> str | None:
+        entries = self.entries.setdefault(avatar_id, OrderedDict())
+        now = time.monotonic()
+        for key in [key for key, (_, _, created_at) in entries.items() if now - created_at > self.ttl]:
+            del entries[key]
+            self.stats["expirations"] += 1
+
+        key = self.normalize(prompt)
+        if key in entries:
+            entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entries[key][1]
+
+        query = self.unit(embedding)
+        candidates = [(key, vector) for key, (vector, _, _) in entries.items() if vector is not None]
+        if query is not None and candidates:
+            similarities = np.stack([vector for _, vector in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entries.move_to_end(candidates[best][0])
+                self.stats["semantic_hits"] += 1
+                return entries[candidates[best][0]][1]
+            self.best_miss_similarities = [*self.best_miss_similarities[-99:], float(similarities[best])]
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, avatar_id: int, prompt: str, embedding: list[float] | None, response: str):
+        entries = self.entries.setdefault(avatar_id, OrderedDict())
+        entries[self.normalize(prompt)] = (self.unit(embedding), response, time.monotonic())
+        entries.move_to_end(self.normalize(prompt))
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def summary(self) -> dict:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {
+            **self.stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "threshold": self.threshold,
+            "entries_per_avatar": {avatar_id: len(entries) for avatar_id, entries in self.entries.items()},
+            "recent_best_miss_similarities": self.best_miss_similarities,
+        }
+
+content_cache = ContentCache(CONTENT_CACHE_MAX_ENTRIES, CONTENT_CACHE_TTL, CONTENT_CACHE_SIMILARITY_THRESHOLD)
+
+# --- Helper Functions for API Clients ---
+# One client per (endpoint, api_key_env_var), each with its own connection pool
+openai_clients: dict[tuple[str, str | None], AsyncOpenAI] = {}
+
+def get_openai_client(provider_endpoint: str, api_key_env_var: str | None) -> AsyncOpenAI:
+    client_key = (provider_endpoint, api_key_env_var)
+    if client_key in openai_clients:
+        return openai_clients[client_key]
+
     api_key = "not-needed"
     if api_key_env_var:
         api_key = os.getenv(api_key_env_var)
         if not api_key:
             logger.error(f"Environment variable '{api_key_env_var}' not set!")
             raise HTTPException(status_code=500, detail="API key configuration error.")
-    return OpenAI(base_url=provider_endpoint, api_key=api_key)
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+    openai_clients[client_key] = AsyncOpenAI(base_url=provider_endpoint, api_key=api_key, http_client=http_client)
+    logger.info(f"Created LLM client for {provider_endpoint}.")
+    return openai_clients[client_key]
+
+async def close_openai_clients():
+    for client in openai_clients.values():
+        await client.close()
+    openai_clients.clear()
 
-def construct_memory_extraction_prompt(user_input: str, avatar_response: str) -> str:
-    """Creates the detailed prompt for the memory extraction LLM."""
-    return f"""You are a memory extraction agent. Your task is to analyze a conversation turn and determine if any new, lasting information about the USER or the AVATAR should be saved.
+SPOKEN_TEXT_RULES = (
+    "Crucially, the output must be a single, continuous block of verbatim text, exactly as someone would speak it. "
+    "Do not use any markdown formatting, lists, bullet points, or any other non-verbal text formatting."
+)
+
+def construct_user_context(interaction: Interaction, user_memory_str: str) -> str:
+    """Describes the user from the perceived affect and their memories, or returns an empty string."""
+    user_context_parts = []
+    if interaction.perceived_user_affect:
+        user_context_parts.append(f"{interaction.perceived_user_affect}")
+    if user_memory_str:
+         user_context_parts.append(f"You remember the following about them: {user_memory_str}.")
+    return f"For context: {' '.join(user_context_parts)}." if user_context_parts else ""
+
+def construct_content_system_prompt(user_context: str) -> str:
+    """Creates the system prompt for generating raw content, including the user context if given."""
+    return " ".join(part for part in ["You are a helpful, factual AI assistant.", user_context] if part)
+
+def construct_persona_prompt(avatar: Avatar, avatar_memory_str: str) -> str:
+    """Creates the persona instructions of the avatar's expression provider."""
+    expression_provider = avatar.expression_provider
+    prompt_parts = [expression_provider.base_prompt_template]
+    prompt_parts.append(f"Your Name is: {avatar.avatar_name}.")
+    if avatar.description:
+        prompt_parts.append(f"Your Description: {avatar.description}.")
+    if avatar_memory_str:
+        prompt_parts.append(f"Remember your own key traits: {avatar_memory_str}.")
+    if expression_provider.reference_text:
+        prompt_parts.append(f"\n\nHere is an example of your desired writing style:\n{expression_provider.reference_text}")
+    return "".join(prompt_parts)
+
+def construct_memory_extraction_prompt(turns: list[tuple[str, str]]) -> str:
+    """Creates the detailed prompt for the memory extraction LLM from one or more (user input, avatar response) turns."""
+    conversation = "\n".join(f"User Input: \"{user_input}\"\nAvatar Response: \"{avatar_response}\"" for user_input, avatar_response in turns)
+    return f"""You are a memory extraction agent. Your task is to analyze conversation turns and determine if any new, lasting information about the USER or the AVATAR should be saved.
 
 Analyze the following conversation:
-User Input: "{user_input}"
-Avatar Response: "{avatar_response}"
+{conversation}
 
-Based on this exchange, should any new facts be stored?
+Based on these exchanges, should any new facts be stored?
 - If the user reveals personal information (e.g., "My name is Tobias", "I'm interested in DSR"), extract it for USER memory.
 - If the avatar makes a statement about itself or its capabilities (e.g., "You can call me Jan"), extract it for AVATAR memory.
 - If no new, lasting information is revealed, call the tool with an empty list.
@@ -67,22 +417,22 @@ Provide your answer ONLY by calling the 'save_memories' tool with a valid list o
 
 # --- API Endpoint ---
 @app.post("/v1/generate-response", response_model=ConversationalResponse)
-async def generate_response(request: ConversationalRequest, db: Session = Depends(get_db)):
+async def generate_response(request: ConversationalRequest, db: AsyncSession = Depends(get_db)):
     """Generates a context-aware and persona-aligned textual response using an interaction ID."""
     logger.info(f"Received request for interaction_id: {request.interaction_id}")
     
     # 1. Fetch all context from the database using the interaction_id
     try:
-        interaction = db.query(Interaction).options(
+        result = await db.execute(select(Interaction).options(
             joinedload(Interaction.session).options(
-                joinedload(DbSession.user).joinedload(User.memories),
+                joinedload(DbSession.user),
                 joinedload(DbSession.avatar).options(
                     joinedload(Avatar.content_provider),
-                    joinedload(Avatar.expression_provider),
-                    joinedload(Avatar.memories)
+                    joinedload(Avatar.expression_provider)
                 )
             )
-        ).filter(Interaction.interaction_id == request.interaction_id).first()
+        ).where(Interaction.interaction_id == request.interaction_id))
+        interaction = result.unique().scalars().first()
 
         if not interaction:
             raise HTTPException(status_code=404, detail=f"Interaction with ID {request.interaction_id} not found.")
@@ -95,134 +445,313 @@ async def generate_response(request: ConversationalRequest, db: Session = Depend
         if not user or not avatar or not avatar.content_provider or not avatar.expression_provider:
             raise HTTPException(status_code=404, detail="Incomplete configuration for the session's user or avatar.")
         
-        # Get the history from the same session, excluding the current interaction
-        interaction_history = db.query(Interaction).filter(
+        # Get the history from the same session that is not yet part of the summary, excluding the current interaction
+        result = await db.execute(select(Interaction).where(
             Interaction.session_id == session.session_id,
-            Interaction.timestamp < interaction.timestamp
-        ).order_by(Interaction.timestamp.asc()).all()
+            Interaction.timestamp < interaction.timestamp,
+            Interaction.interaction_id > (session.summarized_interaction_id or 0)
+        ).order_by(Interaction.timestamp.asc()))
+        interaction_history = result.scalars().all()
+
+        result = await db.execute(select(UserMemory).where(UserMemory.user_id == user.user_id))
+        user_memories = result.scalars().all()
+        result = await db.execute(select(AvatarMemory).where(AvatarMemory.avatar_id == avatar.avatar_id))
+        avatar_memories = result.scalars().all()
 
     except Exception as e:
         logger.error(f"Database error while fetching context for interaction {request.interaction_id}: {e}")
         raise HTTPException(status_code=500, detail="Database error.")
 
+    # End the read transaction, so no pooled connection sits idle while the LLMs and TTS run.
+    # The loaded objects stay usable (expire_on_commit=False); the results are saved in a new short transaction.
+    await db.commit()
+
     if not interaction.user_input_text:
         raise HTTPException(status_code=400, detail="Interaction has no transcribed text to process.")
 
+    # Rank memories by relevance to the input; the query is only embedded when there is something to rank or cache.
+    # Cached content is shared by all users of an avatar, so with the cache enabled every two-stage turn generates its
+    # content without user context or history, and the expression stage adds both when it rephrases the answer
+    use_content_cache = avatar.content_cache_enabled and avatar.generation_mode != "fused"
+    query_embedding = None
+    if use_content_cache or len(user_memories) > MEMORY_TOP_K or len(avatar_memories) > MEMORY_TOP_K:
+        try:
+            query_embedding = (await embed_texts([interaction.user_input_text]))[0]
+        except Exception as e:
+            logger.warning(f"Could not embed input of interaction {request.interaction_id}, using most recent memories: {e}")
+    user_memories = await retrieve_memories(user_memories, query_embedding)
+    avatar_memories = await retrieve_memories(avatar_memories, query_embedding)
+
     # Format memories and history
-    user_memory_str = ", ".join([f"{mem.memory_key}: {mem.memory_value}" for mem in user.memories])
-    avatar_memory_str = ", ".join([f"{mem.memory_key}: {mem.memory_value}" for mem in avatar.memories])
-    conversation_history_messages = [
-        msg for turn in interaction_history 
-        for role, content in [("user", turn.user_input_text), ("assistant", turn.agent_response_text)] 
-        if content for msg in [{"role": role, "content": content}]
-    ]
-
-    # 2. Stage 1: Generate Raw Content
-    try:
-        content_provider = avatar.content_provider
-        content_client = get_openai_client(content_provider.provider_endpoint, content_provider.api_key_env_var)
-        
-        system_prompt_parts = ["You are a helpful, factual AI assistant."]
-        user_context_parts = []
-        if interaction.perceived_user_affect:
-            user_context_parts.append(f"{interaction.perceived_user_affect}")
-        if user_memory_str:
-             user_context_parts.append(f"You remember the following about them: {user_memory_str}.")
-
-        if user_context_parts:
-            system_prompt_parts.append(f"For context: {' '.join(user_context_parts)}.")
-
-        messages_for_content = [
-            {"role": "system", "content": " ".join(system_prompt_parts)},
-            *conversation_history_messages,
-            {"role": "user", "content": interaction.user_input_text}
-        ]
-
-        response = content_client.chat.completions.create(model=content_provider.model_name, messages=messages_for_content)
-        raw_content_response = response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"Error from Content Provider: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get response from content provider.")
+    user_memory_str = ", ".join([f"{mem.memory_key}: {mem.memory_value}" for mem in user_memories])
+    avatar_memory_str = ", ".join([f"{mem.memory_key}: {mem.memory_value}" for mem in avatar_memories])
+    conversation_history_messages = build_history_messages(session, interaction_history)
+    schedule_history_fold(session, interaction_history)
 
-    # 3. Stage 2: Adapt Response to Persona
-    try:
-        expression_provider = avatar.expression_provider
-        expression_client = get_openai_client(expression_provider.provider_endpoint, expression_provider.api_key_env_var)
+    if avatar.generation_mode == "fused":
+        # 2.a Fused mode: one structured call returns both the content and the persona-adapted text
+        try:
+            content_provider = avatar.content_provider
+            content_client = get_openai_client(content_provider.provider_endpoint, content_provider.api_key_env_var)
+
+            system_prompt = (
+                f"{construct_content_system_prompt(construct_user_context(interaction, user_memory_str))} "
+                f"{construct_persona_prompt(avatar, avatar_memory_str)}\n\n"
+                "Answer the user's latest message. Provide the factual answer as raw_content_response, and the same answer "
+                f"rephrased according to your persona as final_response_text. For final_response_text: {SPOKEN_TEXT_RULES}"
+            )
+            messages_for_fused = [
+                {"role": "system", "content": system_prompt},
+                *conversation_history_messages,
+                {"role": "user", "content": interaction.user_input_text}
+            ]
+
+            response = await content_client.chat.completions.create(
+                model=content_provider.model_name,
+                messages=messages_for_fused,
+                tools=[{"type": "function", "function": {"name": "respond", "parameters": FusedResponseTool.model_json_schema()}}],
+                tool_choice={"type": "function", "function": {"name": "respond"}}
+            )
+            fused_response = FusedResponseTool.model_validate_json(response.choices[0].message.tool_calls[0].function.arguments)
+            raw_content_response = fused_response.raw_content_response
+            final_response_text = fused_response.final_response_text.strip().replace("*", "")
+        except Exception as e:
+            logger.error(f"Error from Content Provider in fused mode: {e}")
+            raise HTTPException(status_code=500, detail="Failed to get response from content provider.")
+    else:
+        # 2.b Two-stage mode, Stage 1: Generate Raw Content
+        try:
+            content_provider = avatar.content_provider
+            content_client = get_openai_client(content_provider.provider_endpoint, content_provider.api_key_env_var)
         
-        system_prompt = (
-            "You are an expert at rephrasing text to match a specific persona for a Text-to-Speech engine. "
-            "Your task is to rewrite the provided text according to the persona instructions. "
-            "Crucially, the output must be a single, continuous block of verbatim text, exactly as someone would speak it. "
-            "Do not use any markdown formatting, lists, bullet points, or any other non-verbal text formatting."
-        )
+            if use_content_cache:
+                messages_for_content = [
+                    {"role": "system", "content": construct_content_system_prompt("")},
+                    {"role": "user", "content": interaction.user_input_text}
+                ]
+            else:
+                messages_for_content = [
+                    {"role": "system", "content": construct_content_system_prompt(construct_user_context(interaction, user_memory_str))},
+                    *conversation_history_messages,
+                    {"role": "user", "content": interaction.user_input_text}
+                ]
 
-        prompt_parts = [expression_provider.base_prompt_template]
-        prompt_parts.append(f"Your Name is: {avatar.avatar_name}.")
-        if avatar.description:
-            prompt_parts.append(f"Your Description: {avatar.description}.")
-        if avatar_memory_str:
-            prompt_parts.append(f"Remember your own key traits: {avatar_memory_str}.")
-        if expression_provider.reference_text:
-            prompt_parts.append(f"\n\nHere is an example of your desired writing style:\n{expression_provider.reference_text}")
-        prompt_parts.append(f"\n\nNow, rephrase the following text according to your persona.\nOriginal Text: \"{raw_content_response}\"\n\nRephrased Text:")
+            raw_content_response = content_cache.get(avatar.avatar_id, interaction.user_input_text, query_embedding) if use_content_cache else None
+            if raw_content_response is not None:
+                logger.info(f"Content cache hit for interaction {request.interaction_id}.")
+            else:
+                response = await content_client.chat.completions.create(model=content_provider.model_name, messages=messages_for_content)
+                raw_content_response = response.choices[0].message.content
+                if use_content_cache:
+                    content_cache.put(avatar.avatar_id, interaction.user_input_text, query_embedding, raw_content_response)
+        except Exception as e:
+            logger.error(f"Error from Content Provider: {e}")
+            raise HTTPException(status_code=500, detail="Failed to get response from content provider.")
+
+        # 2.b Two-stage mode, Stage 2: Adapt Response to Persona
+        try:
+            expression_provider = avatar.expression_provider
+            expression_client = get_openai_client(expression_provider.provider_endpoint, expression_provider.api_key_env_var)
         
-        expression_prompt = "".join(prompt_parts)
+            system_prompt = (
+                "You are an expert at rephrasing text to match a specific persona for a Text-to-Speech engine. "
+                "Your task is to rewrite the provided text according to the persona instructions. "
+                f"{SPOKEN_TEXT_RULES}"
+            )
+
+            expression_prompt = (
+                f"{construct_persona_prompt(avatar, avatar_memory_str)}"
+                f"\n\nNow, rephrase the following text according to your persona.\nOriginal Text: \"{raw_content_response}\"\n\nRephrased Text:"
+            )
+            if use_content_cache:
+                # The content was written without knowing the user or the conversation, so it is personalized here
+                context_parts = [
+                    construct_persona_prompt(avatar, avatar_memory_str),
+                    f"The user's latest message was: \"{interaction.user_input_text}\"",
+                    construct_user_context(interaction, user_memory_str),
+                    "The original text below is a general answer that knows neither the user nor the conversation so far. "
+                    "Rephrase it according to your persona and tailor it with what you know about the user and the conversation; "
+                    "where only that context can answer the message, answer from the context instead.",
+                ]
+                expression_prompt = "\n\n".join(part for part in context_parts if part) + f"\nOriginal Text: \"{raw_content_response}\"\n\nRephrased Text:"
         
-        messages_for_expression = [
-            {"role": "system", "content": system_prompt},
-            *conversation_history_messages,
-            {"role": "user", "content": expression_prompt}
-        ]
-
-        response = expression_client.chat.completions.create(model=expression_provider.model_name, messages=messages_for_expression)
-        final_response_text = response.choices[0].message.content.strip().replace("*", "") # Clean up common markdown artifacts
-    except Exception as e:
-        logger.error(f"Error from Expression Provider: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get response from expression provider.")
+            messages_for_expression = [
+                {"role": "system", "content": system_prompt},
+                *conversation_history_messages,
+                {"role": "user", "content": expression_prompt}
+            ]
+
+            if SENTENCE_PIPELINING and VOCAL_SERVICE_URL:
+                # Stream the completion and send every finished sentence to TTS right away
+                events = await expression_client.chat.completions.create(model=expression_provider.model_name, messages=messages_for_expression, stream=True)
+                splitter = SentenceSplitter()
+                response_parts, segment_tasks = [], []
+
+                def dispatch(sentences: list[str]):
+                    for sentence in sentences:
+                        sentence = sentence.replace("*", "").strip()
+                        if sentence:
+                            segment_tasks.append(asyncio.create_task(synthesize_segment(request.interaction_id, len(segment_tasks), sentence)))
+
+                async for event in events:
+                    delta = event.choices[0].delta.content if event.choices else None
+                    if delta:
+                        response_parts.append(delta)
+                        dispatch(splitter.feed(delta))
+                dispatch(splitter.flush())
+                await asyncio.gather(*segment_tasks, return_exceptions=True)
+                final_response_text = "".join(response_parts).strip().replace("*", "")
+                logger.info(f"Pipelined {len(segment_tasks)} sentence segments to the vocal service.")
+            else:
+                response = await expression_client.chat.completions.create(model=expression_provider.model_name, messages=messages_for_expression)
+                final_response_text = response.choices[0].message.content.strip().replace("*", "") # Clean up common markdown artifacts
+        except Exception as e:
+            logger.error(f"Error from Expression Provider: {e}")
+            raise HTTPException(status_code=500, detail="Failed to get response from expression provider.")
     
+    # 3. Save the text and enqueue memory extraction (Stage 3) in the same transaction.
+    # The interaction_id is the idempotency key, so a retried turn is only extracted once.
     try:
         interaction.raw_content_response = raw_content_response
         interaction.agent_response_text = final_response_text
-        db.commit()
+        await db.execute(insert(MemoryExtractionJob).values(interaction_id=interaction.interaction_id).on_conflict_do_nothing(index_elements=["interaction_id"]))
+        await db.commit()
         logger.info(f"Successfully saved generated text to interaction {request.interaction_id}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Failed to save text to database for interaction {request.interaction_id}: {e}")
         raise HTTPException(status_code=500, detail="Database update failed after text generation.")
     
-    # 4. Stage 3: Update Memory
-    logger.info(f"Starting Memory Extraction for interaction {request.interaction_id}...")
+    return ConversationalResponse(
+        raw_content_response=raw_content_response,
+        final_response_text=final_response_text
+    )
+
+# --- Stage 3: Memory Extraction Queue ---
+async def claim_memory_jobs(worker_id: str) -> list[int]:
+    """Claims a batch of queued (or abandoned) memory jobs and returns their interaction IDs."""
+    lease_cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=MEMORY_JOB_LEASE_TIMEOUT)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(MemoryExtractionJob).where(
+                or_(
+                    MemoryExtractionJob.status == "queued",
+                    and_(MemoryExtractionJob.status == "running", MemoryExtractionJob.locked_at < lease_cutoff)
+                )
+            ).order_by(MemoryExtractionJob.created_at.asc()).limit(MEMORY_BATCH_SIZE).with_for_update(skip_locked=True)
+        )
+        claimed = []
+        for job in result.scalars().all():
+            if job.attempts >= MEMORY_JOB_MAX_ATTEMPTS:
+                logger.error(f"Giving up memory extraction for interaction {job.interaction_id} after {job.attempts} attempts.")
+                job.status = "failed"
+                job.locked_by = None
+                continue
+            job.status = "running"
+            job.locked_by = worker_id
+            job.locked_at = datetime.datetime.utcnow()
+            job.attempts += 1
+            claimed.append(job.interaction_id)
+        await db.commit()
+    return claimed
+
+async def upsert_memory(db: AsyncSession, item: MemoryItem, embedding: list[float], session: DbSession):
+    """Inserts a memory or updates the existing one with the same owner and key."""
+    if item.memory_kind == "user":
+        owner, memory_type, index_where = {"user_id": session.user_id}, "user_memory", UserMemory.user_id.isnot(None)
+    else:
+        owner, memory_type, index_where = {"avatar_id": session.avatar_id}, "avatar_memory", AvatarMemory.avatar_id.isnot(None)
+
+    statement = insert(Memory.__table__).values(
+        memory_type=memory_type, memory_key=item.memory_key, memory_value=item.memory_value,
+        embedding=embedding, last_updated=datetime.datetime.utcnow(), **owner
+    )
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[*owner, "memory_key"],
+        index_where=index_where,
+        set_={"memory_value": statement.excluded.memory_value, "embedding": statement.excluded.embedding, "last_updated": statement.excluded.last_updated}
+    ))
+
+async def extract_memories(worker_id: str, interactions: list[Interaction]):
+    """Runs one memory extraction call for several turns of the same user and avatar and saves the results."""
+    session = interactions[0].session
+    interaction_ids = [interaction.interaction_id for interaction in interactions]
     try:
-        memory_client = OpenAI(base_url=LLM_HOST, api_key=LLM_API_KEY)
-        prompt = construct_memory_extraction_prompt(interaction.user_input_text, final_response_text)
-        
-        response = memory_client.chat.completions.create(
+        memory_client = get_openai_client(LLM_HOST, "LLM_API_KEY")
+        prompt = construct_memory_extraction_prompt([(i.user_input_text, i.agent_response_text) for i in interactions])
+
+        response = await memory_client.chat.completions.create(
             model=LLM_MODEL,
             messages=[{"role": "system", "content": "You are a memory extraction agent."}, {"role": "user", "content": prompt}],
             tools=[{"type": "function", "function": {"name": "save_memories", "parameters": MemoryExtractionTool.model_json_schema()}}],
             tool_choice={"type": "function", "function": {"name": "save_memories"}}
         )
-        
+
         tool_call = response.choices[0].message.tool_calls[0] if response.choices[0].message.tool_calls else None
-        if tool_call:
-            extracted_data = MemoryExtractionTool.model_validate_json(tool_call.function.arguments)
-            for item in extracted_data.memories:
-                if item.memory_kind == "user":
-                    db.add(UserMemory(user_id=user.user_id, memory_key=item.memory_key, memory_value=item.memory_value))
-                elif item.memory_kind == "avatar":
-                    db.add(AvatarMemory(avatar_id=avatar.avatar_id, memory_key=item.memory_key, memory_value=item.memory_value))
-            db.commit()
-            logger.info(f"Saved {len(extracted_data.memories)} new memories.")
-        else:
-            logger.info("No new memories to save.")
+        memories = MemoryExtractionTool.model_validate_json(tool_call.function.arguments).memories if tool_call else []
+        embeddings = await embed_texts([memory_text(item.memory_key, item.memory_value) for item in memories]) if memories else []
     except Exception as e:
-        logger.error(f"Memory extraction failed: {e}")
-        db.rollback() # Rollback memory additions on failure
+        logger.error(f"Memory extraction failed for interactions {interaction_ids}: {e}")
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(MemoryExtractionJob).where(
+                    MemoryExtractionJob.interaction_id.in_(interaction_ids), MemoryExtractionJob.locked_by == worker_id
+                ).values(status="queued", locked_by=None, last_error=str(e))
+            )
+            await db.commit()
+        return
 
-    return ConversationalResponse(
-        raw_content_response=raw_content_response,
-        final_response_text=final_response_text
-    )
+    # Memories and job completion are committed together, so a batch is never saved twice
+    async with AsyncSessionLocal() as db:
+        try:
+            # Later facts in the batch win when the same key is extracted more than once
+            latest = {(item.memory_kind, item.memory_key): (item, embedding) for item, embedding in zip(memories, embeddings)}
+            for item, embedding in latest.values():
+                await upsert_memory(db, item, embedding, session)
+            await db.execute(
+                update(MemoryExtractionJob).where(
+                    MemoryExtractionJob.interaction_id.in_(interaction_ids), MemoryExtractionJob.locked_by == worker_id
+                ).values(status="done", locked_by=None, last_error=None)
+            )
+            await db.commit()
+            logger.info(f"Saved {len(latest)} memories from {len(interaction_ids)} turns.")
+        except Exception as e:
+            logger.error(f"Failed to save memories for interactions {interaction_ids}: {e}")
+            await db.rollback() # The lease expires and the batch is retried
+
+async def memory_worker(worker_id: str):
+    """Claims batches of finished turns and extracts memories until cancelled."""
+    while True:
+        try:
+            interaction_ids = await claim_memory_jobs(worker_id)
+            if interaction_ids:
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(select(Interaction).options(joinedload(Interaction.session)).where(
+                        Interaction.interaction_id.in_(interaction_ids)
+                    ).order_by(Interaction.timestamp.asc()))
+                    interactions = result.scalars().all()
+
+                # One LLM call per user/avatar pair, since memories are stored per user and avatar
+                batches: dict[tuple[int, int], list[Interaction]] = {}
+                for interaction in interactions:
+                    batches.setdefault((interaction.session.user_id, interaction.session.avatar_id), []).append(interaction)
+                await asyncio.gather(*(extract_memories(worker_id, batch) for batch in batches.values()))
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Memory worker {worker_id} failed to process batch: {e}")
+        await asyncio.sleep(MEMORY_POLL_INTERVAL)
+
+@app.get("/v1/stats/content-cache")
+async def content_cache_stats():
+    """Returns hit/miss counters of the content cache for tuning the similarity threshold."""
+    return content_cache.summary()
+
+@app.get("/v1/stats/http")
+async def http_stats():
+    """Returns connection pool statistics of the shared HTTP client."""
+    return get_http_stats()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
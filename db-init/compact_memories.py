@@ -0,0 +1,31 @@
+import logging
+from sqlalchemy import text
+from utils.db import engine, user_memory_key_index, avatar_memory_key_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keeps the most recently updated row per owner and memory_key
+DELETE_DUPLICATES = """
+DELETE FROM memory WHERE memory_id IN (
+    SELECT memory_id FROM (
+        SELECT memory_id, ROW_NUMBER() OVER (
+            PARTITION BY {owner_column}, memory_key ORDER BY last_updated DESC NULLS LAST, memory_id DESC
+        ) AS row_number
+        FROM memory WHERE {owner_column} IS NOT NULL
+    ) ranked WHERE row_number > 1
+)
+"""
+
+def compact_memories():
+    """One-off job: removes duplicate memories and adds the unique indexes that memory upserts rely on."""
+    with engine.begin() as connection:
+        for owner_column in ("user_id", "avatar_id"):
+            result = connection.execute(text(DELETE_DUPLICATES.format(owner_column=owner_column)))
+            logger.info(f"Removed {result.rowcount} duplicate memories by {owner_column}.")
+        user_memory_key_index.create(bind=connection, checkfirst=True)
+        avatar_memory_key_index.create(bind=connection, checkfirst=True)
+    logger.info("Memory compaction completed successfully!")
+
+if __name__ == "__main__":
+    compact_memories()
@@ -6,6 +6,9 @@ from utils.db import (
     UserMemory, AvatarMemory, Session as DbSession, Interaction
 )
 
+from migrate_schema import migrate_schema
+from compact_memories import compact_memories
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -122,6 +125,8 @@ def create_example_data(db: Session):
 if __name__ == "__main__":
     logger.info("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
+    compact_memories() # memory upserts need its unique indexes; a no-op once they exist
     
     db_session = Session(engine)
     try:
@@ -0,0 +1,32 @@
+import logging
+from sqlalchemy import text
+from utils.db import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns added to tables that already existed. create_all only creates missing tables,
+# so existing databases get these columns here; every statement is safe to run repeatedly.
+ADD_COLUMNS = [
+    'ALTER TABLE provider ADD COLUMN IF NOT EXISTS asr_backend VARCHAR(50)',
+    'ALTER TABLE provider ADD COLUMN IF NOT EXISTS asr_beam_size INTEGER',
+    'ALTER TABLE memory ADD COLUMN IF NOT EXISTS embedding FLOAT[]',
+    "ALTER TABLE avatar ADD COLUMN IF NOT EXISTS generation_mode VARCHAR(50) NOT NULL DEFAULT 'two_stage'",
+    'ALTER TABLE avatar ADD COLUMN IF NOT EXISTS content_cache_enabled BOOLEAN NOT NULL DEFAULT false',
+    'ALTER TABLE session ADD COLUMN IF NOT EXISTS history_summary TEXT',
+    'ALTER TABLE session ADD COLUMN IF NOT EXISTS summarized_interaction_id INTEGER',
+    'ALTER TABLE interaction ADD COLUMN IF NOT EXISTS generated_audio_sha256 VARCHAR(64)',
+    'ALTER TABLE tts_cache_entry ADD COLUMN IF NOT EXISTS audio_sha256 VARCHAR(64)',
+    'ALTER TABLE orchestration_job ADD COLUMN IF NOT EXISTS awaiting_video_since TIMESTAMP WITHOUT TIME ZONE',
+    'ALTER TABLE orchestration_job ADD COLUMN IF NOT EXISTS next_video_check_at TIMESTAMP WITHOUT TIME ZONE',
+]
+
+def migrate_schema():
+    """Adds columns introduced after a database was created. Run after create_all."""
+    with engine.begin() as connection:
+        for statement in ADD_COLUMNS:
+            connection.execute(text(statement))
+    logger.info(f"Schema migration completed successfully ({len(ADD_COLUMNS)} column checks)!")
+
+if __name__ == "__main__":
+    migrate_schema()
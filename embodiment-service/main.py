@@ -2,25 +2,45 @@ import os
 import uvicorn
 import logging
 import httpx
-import boto3
-import tempfile
+from contextlib import asynccontextmanager
+import hmac
+import hashlib
 from botocore.exceptions import ClientError
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Header
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from utils.db import get_db, Avatar, Interaction, Session as DbSession
+from utils.db import get_db, Avatar, Interaction, VideoRenderCache, Session as DbSession
+from utils import storage
+from utils.http import get_http_client, close_http_client, get_http_stats, TIMEOUT_PROFILES
+from utils.notifications import publish, VIDEO_STATUS_CHANNEL
 
-S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
-S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
-S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
 S3_VIDEO_BUCKET_NAME = os.getenv("S3_VIDEO_BUCKET_NAME", "video-outputs")
 S3_AUDIO_BUCKET_NAME = os.getenv("S3_AUDIO_BUCKET_NAME", "audio-outputs")
+VIDEO_WIDTH = int(os.getenv("VIDEO_WIDTH", "1280"))
+VIDEO_HEIGHT = int(os.getenv("VIDEO_HEIGHT", "720"))
+# Identical audio for the same avatar reuses the uploaded asset and, once finished, the rendered video
+VIDEO_DEDUP_ENABLED = os.getenv("VIDEO_DEDUP_ENABLED", "true").lower() == "true"
+
+# Public URL under which HeyGen reaches this service (NGINX forwards /webhooks/heygen to /v1/webhooks/heygen).
+# Webhooks are only used with a secret to verify them; otherwise completion is only detected by polling
+HEYGEN_WEBHOOK_URL = os.getenv("HEYGEN_WEBHOOK_URL")
+HEYGEN_WEBHOOK_SECRET = os.getenv("HEYGEN_WEBHOOK_SECRET")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_client()
+    yield
+    await close_http_client()
 
 app = FastAPI(
     title="Embodiment Engine",
     description="Starts and monitors the generation of a talking head video.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -32,73 +52,177 @@ class EmbodimentRequest(BaseModel):
 class EmbodimentResponse(BaseModel):
     heygen_video_id: str = Field(..., description="The video ID returned by HeyGen for tracking.")
     message: str = "Video generation started successfully."
+    generated_video_key: str | None = Field(None, description="The S3 key of the video if an earlier render was reused.")
 
 class StatusResponse(BaseModel):
     status: str = Field(..., description="The current status of the video generation (e.g., 'processing', 'completed', 'failed').")
     generated_video_key: str | None = Field(None, description="The S3 key for the final video if completed.")
 
-def get_s3_client():
+class HeyGenWebhookEvent(BaseModel):
+    event_type: str = Field(..., description="E.g. 'avatar_video.success' or 'avatar_video.fail'.")
+    event_data: dict = Field(default_factory=dict)
+
+async def publish_video_status(db: AsyncSession, interaction_id: int, status: str, generated_video_key: str | None = None):
+    """Notifies waiting orchestrators that a video reached a final status."""
     try:
-        s3_client = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL, aws_access_key_id=S3_ACCESS_KEY_ID, aws_secret_access_key=S3_SECRET_ACCESS_KEY)
-        return s3_client
+        await publish(db, VIDEO_STATUS_CHANNEL, {"interaction_id": interaction_id, "status": status, "generated_video_key": generated_video_key})
     except Exception as e:
-        logger.error(f"Failed to create S3 client: {e}")
-        return None
+        logger.error(f"Failed to publish video status for interaction {interaction_id}: {e}")
+        await db.rollback()
+
+async def store_completed_video(interaction: Interaction, final_video_url: str, db: AsyncSession) -> str:
+    """
+    Streams a finished video from the provider into S3 and records the key.
+    The download is piped into a multipart upload, so memory stays flat
+    regardless of the video length.
+    """
+    video_s3_key = f"interaction_{interaction.interaction_id}.mp4"
+    client = get_http_client()
+    try:
+        # 1. Stream the final video from the provider ...
+        async with client.stream("GET", final_video_url, timeout=TIMEOUT_PROFILES["extended"]) as video_response:
+            video_response.raise_for_status()
+            # 2. ... straight into our S3
+            await storage.upload_stream(video_response.aiter_bytes(), S3_VIDEO_BUCKET_NAME, video_s3_key, content_type='video/mp4')
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to download completed video from provider: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload final video to S3: {e}")
+
+    try:
+        # 3. Update our database record, and make the video reusable for identical audio
+        interaction.generated_video_url = video_s3_key
+        await db.execute(update(VideoRenderCache).where(VideoRenderCache.provider_video_id == interaction.video_provider_task_id).values(video_s3_key=video_s3_key))
+        # Interactions that joined this render while it was in progress get the same video
+        result = await db.execute(update(Interaction).where(
+            Interaction.video_provider_task_id == interaction.video_provider_task_id,
+            Interaction.interaction_id != interaction.interaction_id,
+            Interaction.generated_video_url.is_(None)
+        ).values(generated_video_url=video_s3_key).returning(Interaction.interaction_id))
+        joined_interaction_ids = result.scalars().all()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update DB with final video key: {e}")
+
+    for interaction_id in [interaction.interaction_id, *joined_interaction_ids]:
+        await publish_video_status(db, interaction_id, "completed", video_s3_key)
+    return video_s3_key
+
+async def fail_render(provider_video_id: str, db: AsyncSession):
+    """
+    Drops the render cache entry of a failed render, so later identical audio uploads a
+    fresh asset instead of reusing a broken one, and notifies every interaction waiting on it.
+    """
+    try:
+        await db.execute(delete(VideoRenderCache).where(VideoRenderCache.provider_video_id == provider_video_id))
+        result = await db.execute(select(Interaction.interaction_id).where(Interaction.video_provider_task_id == provider_video_id))
+        interaction_ids = result.scalars().all()
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to record the failure of video {provider_video_id}: {e}")
+        await db.rollback()
+        return
+    for interaction_id in interaction_ids:
+        await publish_video_status(db, interaction_id, "failed")
 
 @app.post("/v1/generate", response_model=EmbodimentResponse)
-async def generate_video(request: EmbodimentRequest, db: Session = Depends(get_db)):
+async def generate_video(request: EmbodimentRequest, db: AsyncSession = Depends(get_db)):
     """Starts the video generation process and returns a task ID."""
     logger.info(f"Received request to generate video for interaction_id: {request.interaction_id}")
 
     # 1. Fetch data
-    interaction = db.query(Interaction).options(joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.video_provider)).filter(Interaction.interaction_id == request.interaction_id).first()
+    result = await db.execute(select(Interaction).options(joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.video_provider)).where(Interaction.interaction_id == request.interaction_id))
+    interaction = result.scalars().first()
     if not interaction or not interaction.session.avatar.video_provider:
         raise HTTPException(status_code=404, detail="Interaction or associated video provider not found.")
+    if interaction.video_provider_task_id:
+        # A retried orchestration step must not start a second (paid) render for the same interaction
+        logger.info(f"Video {interaction.video_provider_task_id} was already started for interaction {request.interaction_id}.")
+        return EmbodimentResponse(heygen_video_id=interaction.video_provider_task_id, message="Video generation was already started.", generated_video_key=interaction.generated_video_url)
     video_provider = interaction.session.avatar.video_provider
     audio_s3_key = interaction.generated_audio_url
     if not audio_s3_key:
         raise HTTPException(status_code=404, detail="No generated audio key found.")
-
-    # 2. Download Audio from S3
-    s3_client = get_s3_client()
-    if not s3_client: raise HTTPException(status_code=500, detail="S3 client not available.")
-    temp_audio_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            s3_client.download_fileobj(S3_AUDIO_BUCKET_NAME, audio_s3_key, temp_file)
-            temp_audio_path = temp_file.name
-    except ClientError as e:
-        raise HTTPException(status_code=404, detail=f"Audio file not found in S3: {e}")
-    
-    # 3. Upload Audio Asset to HeyGen
     api_key = os.getenv(video_provider.api_key_env_var)
-    if not api_key: raise HTTPException(status_code=500, detail="HeyGen API key not configured.")
-    audio_asset_id = None
-    try:
-        with open(temp_audio_path, "rb") as f:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post("https://upload.heygen.com/v1/asset", headers={"x-api-key": api_key, "Content-Type": "audio/mpeg"}, data=f.read())
-                response.raise_for_status()
-                audio_asset_id = response.json().get("data", {}).get("id")
-        if not audio_asset_id: raise ValueError("Could not extract audio asset ID.")
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Error uploading asset to HeyGen: {e}")
-    finally:
-        if temp_audio_path: os.remove(temp_audio_path)
+    if not api_key:
+        raise HTTPException(status_code=500, detail="HeyGen API key not configured.")
+
+    # 2. Look up earlier renders of the same audio, avatar and dimensions
+    render = None
+    render_key = {"audio_sha256": interaction.generated_audio_sha256, "provider_avatar_id": video_provider.provider_avatar_id, "width": VIDEO_WIDTH, "height": VIDEO_HEIGHT}
+    if VIDEO_DEDUP_ENABLED and interaction.generated_audio_sha256:
+        result = await db.execute(select(VideoRenderCache).filter_by(**render_key))
+        render = result.scalars().first()
+    if render and render.video_s3_key:
+        logger.info(f"Reusing rendered video '{render.video_s3_key}' for interaction {request.interaction_id}.")
+        try:
+            interaction.video_provider_task_id = render.provider_video_id
+            interaction.generated_video_url = render.video_s3_key
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Failed to update DB with reused video key: {e}")
+        await publish_video_status(db, interaction.interaction_id, "completed", render.video_s3_key)
+        return EmbodimentResponse(heygen_video_id=render.provider_video_id, message="Reused an earlier rendered video.", generated_video_key=render.video_s3_key)
+
+    if render and render.provider_video_id:
+        # The same audio is still rendering: follow that render instead of paying for a second one
+        logger.info(f"Joining render {render.provider_video_id} in progress for interaction {request.interaction_id}.")
+        try:
+            interaction.video_provider_task_id = render.provider_video_id
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Failed to update DB with the render in progress: {e}")
+        return EmbodimentResponse(heygen_video_id=render.provider_video_id, message="Joined a render of the same audio in progress.")
+
+    # End the read transaction, so no pooled connection sits idle during the upload and the HeyGen calls
+    await db.commit()
+    if render:
+        # The asset is already at HeyGen, only the render has to be started
+        audio_asset_id = render.audio_asset_id
+    else:
+        # 3. Stream the audio from S3 into a HeyGen audio asset
+        try:
+            audio_object = await storage.open_object(S3_AUDIO_BUCKET_NAME, audio_s3_key)
+        except ClientError as e:
+            raise HTTPException(status_code=404, detail=f"Audio file not found in S3: {e}")
+
+        audio_asset_id = None
+        try:
+            client = get_http_client()
+            headers = {"x-api-key": api_key, "Content-Type": "audio/mpeg", "Content-Length": str(audio_object["ContentLength"])}
+            response = await client.post("https://upload.heygen.com/v1/asset", headers=headers, content=storage.iter_body(audio_object["Body"]), timeout=TIMEOUT_PROFILES["default"])
+            response.raise_for_status()
+            audio_asset_id = response.json().get("data", {}).get("id")
+            if not audio_asset_id: raise ValueError("Could not extract audio asset ID.")
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error uploading asset to HeyGen: {e}")
+        finally:
+            audio_object["Body"].close()
 
     # 4. Start Video Generation
-    payload = {"video_inputs": [{"character": {"type": "talking_photo", "talking_photo_id": video_provider.provider_avatar_id}, "voice": {"type": "audio", "audio_asset_id": audio_asset_id}}], "dimension": {"width": 1280, "height": 720}}
+    payload = {"video_inputs": [{"character": {"type": "talking_photo", "talking_photo_id": video_provider.provider_avatar_id}, "voice": {"type": "audio", "audio_asset_id": audio_asset_id}}], "dimension": {"width": VIDEO_WIDTH, "height": VIDEO_HEIGHT}, "callback_id": str(interaction.interaction_id)}
+    if HEYGEN_WEBHOOK_URL and HEYGEN_WEBHOOK_SECRET:
+        payload["callback_url"] = HEYGEN_WEBHOOK_URL
     heygen_video_id = None
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post("https://api.heygen.com/v2/video/generate", headers={"x-api-key": api_key, "Content-Type": "application/json"}, json=payload)
-            response.raise_for_status()
-            heygen_video_id = response.json().get("data", {}).get("video_id")
+        client = get_http_client()
+        response = await client.post("https://api.heygen.com/v2/video/generate", headers={"x-api-key": api_key, "Content-Type": "application/json"}, json=payload, timeout=TIMEOUT_PROFILES["short"])
+        response.raise_for_status()
+        heygen_video_id = response.json().get("data", {}).get("video_id")
         if not heygen_video_id: raise ValueError("Could not extract video_id.")
         
-        # 5. Store the provider's task ID in our database
+        # 5. Store the provider's task ID in our database, and index the asset and render for reuse
         interaction.video_provider_task_id = heygen_video_id
-        db.commit()
+        if VIDEO_DEDUP_ENABLED and interaction.generated_audio_sha256:
+            statement = insert(VideoRenderCache).values(**render_key, audio_asset_id=audio_asset_id, provider_video_id=heygen_video_id)
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=list(render_key),
+                set_={"audio_asset_id": statement.excluded.audio_asset_id, "provider_video_id": statement.excluded.provider_video_id}
+            ))
+        await db.commit()
         
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Error starting HeyGen video generation: {e}")
@@ -106,7 +230,7 @@ async def generate_video(request: EmbodimentRequest, db: Session = Depends(get_d
     return EmbodimentResponse(heygen_video_id=heygen_video_id)
 
 @app.get("/v1/status/{interaction_id}", response_model=StatusResponse)
-async def get_video_status(interaction_id: int, db: Session = Depends(get_db)):
+async def get_video_status(interaction_id: int, db: AsyncSession = Depends(get_db)):
     """
     Checks the status of a video generation task. If complete, downloads the
     video and saves it to S3.
@@ -114,9 +238,14 @@ async def get_video_status(interaction_id: int, db: Session = Depends(get_db)):
     logger.info(f"Checking status for interaction_id: {interaction_id}")
     
     # 1. Fetch the interaction record to get the provider task ID
-    interaction = db.query(Interaction).options(joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.video_provider)).filter(Interaction.interaction_id == interaction_id).first()
+    result = await db.execute(select(Interaction).options(joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.video_provider)).where(Interaction.interaction_id == interaction_id))
+    interaction = result.scalars().first()
     if not interaction or not interaction.video_provider_task_id:
         raise HTTPException(status_code=404, detail="Interaction or provider task ID not found.")
+    if interaction.generated_video_url:
+        # Already stored, e.g. by the webhook receiver
+        return StatusResponse(status="completed", generated_video_key=interaction.generated_video_url)
+    await db.commit() # ends the read transaction before the HeyGen status call and the video download
     
     # 2. Call HeyGen status endpoint
     video_provider = interaction.session.avatar.video_provider
@@ -124,10 +253,10 @@ async def get_video_status(interaction_id: int, db: Session = Depends(get_db)):
     status_url = f"https://api.heygen.com/v1/video_status.get?video_id={interaction.video_provider_task_id}"
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(status_url, headers={"x-api-key": api_key})
-            response.raise_for_status()
-            status_data = response.json().get("data", {})
+        client = get_http_client()
+        response = await client.get(status_url, headers={"x-api-key": api_key}, timeout=TIMEOUT_PROFILES["short"])
+        response.raise_for_status()
+        status_data = response.json().get("data", {})
         video_status = status_data.get("status")
         logger.info(f"HeyGen status for video {interaction.video_provider_task_id} is: {video_status}")
     except Exception as e:
@@ -138,36 +267,59 @@ async def get_video_status(interaction_id: int, db: Session = Depends(get_db)):
         final_video_url = status_data.get("video_url")
         if not final_video_url:
             raise HTTPException(status_code=500, detail="Video completed but no URL provided by HeyGen.")
-        
-        # 3a. Download the final video
-        try:
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                video_response = await client.get(final_video_url)
-                video_response.raise_for_status()
-                video_content = video_response.content
-        except Exception as e:
-            raise HTTPException(status_code=502, detail=f"Failed to download completed video from provider: {e}")
-            
-        # 3b. Upload final video to our S3
-        s3_client = get_s3_client()
-        if not s3_client: raise HTTPException(status_code=500, detail="S3 client not available.")
-        video_s3_key = f"interaction_{interaction_id}.mp4"
-        try:
-            s3_client.put_object(Bucket=S3_VIDEO_BUCKET_NAME, Key=video_s3_key, Body=video_content, ContentType='video/mp4')
-            
-            # 3c. Update our database record
-            interaction.generated_video_url = video_s3_key
-            db.commit()
-            
-            return StatusResponse(status="completed", generated_video_key=video_s3_key)
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to upload final video to S3 or update DB: {e}")
+        video_s3_key = await store_completed_video(interaction, final_video_url, db)
+        return StatusResponse(status="completed", generated_video_key=video_s3_key)
     
     elif video_status == "failed":
+        await fail_render(interaction.video_provider_task_id, db)
         return StatusResponse(status="failed", generated_video_key=None)
     else: # Still processing
         return StatusResponse(status=video_status, generated_video_key=None)
 
+@app.post("/v1/webhooks/heygen")
+async def receive_heygen_webhook(request: Request, signature: str | None = Header(None), db: AsyncSession = Depends(get_db)):
+    """
+    Receives HeyGen render events. Stores finished videos in S3 and publishes
+    the final status so waiting orchestrators resume without polling.
+    """
+    # Unverified events could make this service fetch arbitrary URLs into the video bucket
+    if not HEYGEN_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhooks are disabled, no webhook secret is configured.")
+    body = await request.body()
+    expected_signature = hmac.new(HEYGEN_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    if not signature or not hmac.compare_digest(expected_signature, signature):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature.")
+
+    event = HeyGenWebhookEvent.model_validate_json(body)
+    video_id = event.event_data.get("video_id")
+    logger.info(f"Received HeyGen webhook '{event.event_type}' for video {video_id}")
+
+    interaction = None
+    if video_id:
+        result = await db.execute(select(Interaction).where(Interaction.video_provider_task_id == video_id))
+        interaction = result.scalars().first()
+        await db.commit() # ends the read transaction before the video download
+    if not interaction:
+        # Acknowledge anyway so HeyGen does not keep retrying events we cannot map
+        logger.warning(f"No interaction found for HeyGen video {video_id}, ignoring event.")
+        return {"status": "ignored"}
+
+    if event.event_type == "avatar_video.success":
+        if not interaction.generated_video_url:
+            final_video_url = event.event_data.get("url")
+            if not final_video_url:
+                raise HTTPException(status_code=400, detail="Webhook event contains no video URL.")
+            await store_completed_video(interaction, final_video_url, db)
+    elif event.event_type == "avatar_video.fail":
+        logger.error(f"HeyGen reported failure for video {video_id}: {event.event_data.get('msg')}")
+        await fail_render(video_id, db)
+
+    return {"status": "received"}
+
+@app.get("/v1/stats/http")
+async def http_stats():
+    """Returns connection pool statistics of the shared HTTP client."""
+    return get_http_stats()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
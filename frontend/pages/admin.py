@@ -5,6 +5,9 @@ from utils.db import (
     ExpressionProvider, ContentProvider, PerceptionProvider, Avatar
 )
 
+GENERATION_MODES = ["two_stage", "fused"]
+ASR_BACKENDS = ["whisper", "faster_whisper"]
+
 st.set_page_config(page_title="Admin Dashboard", layout="wide")
 st.title("Admin Dashboard")
 
@@ -36,11 +39,13 @@ with st.expander("Create New Provider"):
         api_key_env_var = st.text_input("API Key Environment Variable (e.g., 'HEYGEN_API_KEY')")
         
         # Additional fields based on provider type
-        model_name = st.text_input("Model Name (e.g., 'gpt-4o')", key="new_provider_model_name") if provider_type in ["ContentProvider", "ExpressionProvider"] else None
+        model_name = st.text_input("Model Name (e.g., 'gpt-4o', or an ASR model like 'base')", key="new_provider_model_name") if provider_type in ["ContentProvider", "ExpressionProvider", "PerceptionProvider"] else None
         provider_voice_id = st.text_input("Provider Voice ID", key="new_provider_voice_id") if provider_type == "AudioProvider" else None
         provider_avatar_id = st.text_input("Provider Avatar/Photo ID", key="new_provider_avatar_id") if provider_type == "VideoProvider" else None
         base_prompt_template = st.text_area("Base Prompt Template", key="new_prompt") if provider_type == "ExpressionProvider" else None
         reference_text = st.text_area("Reference Text", key="new_ref_text") if provider_type == "ExpressionProvider" else None
+        asr_backend = st.selectbox("ASR Backend", options=ASR_BACKENDS, key="new_asr_backend") if provider_type == "PerceptionProvider" else None
+        asr_beam_size = st.number_input("ASR Beam Size (0 = backend default)", min_value=0, value=0, key="new_asr_beam_size") if provider_type == "PerceptionProvider" else None
 
         if st.form_submit_button("Create Provider"):
             try:
@@ -54,7 +59,7 @@ with st.expander("Create New Provider"):
                 elif provider_type == "VideoProvider":
                     new_provider = VideoProvider(provider_name=provider_name, provider_endpoint=provider_endpoint, api_key_env_var=api_key_env_var, provider_avatar_id=provider_avatar_id)
                 elif provider_type == "PerceptionProvider":
-                    new_provider = PerceptionProvider(provider_name=provider_name, provider_endpoint=provider_endpoint, api_key_env_var=api_key_env_var)
+                    new_provider = PerceptionProvider(provider_name=provider_name, provider_endpoint=provider_endpoint, api_key_env_var=api_key_env_var, model_name=model_name or None, asr_backend=asr_backend, asr_beam_size=asr_beam_size or None)
 
                 if new_provider:
                     db.add(new_provider)
@@ -86,11 +91,13 @@ with st.expander("Edit or Delete Existing Provider"):
             endpoint = st.text_input("Provider Endpoint", value=selected_provider.provider_endpoint)
             api_key_var = st.text_input("API Key Env Var", value=selected_provider.api_key_env_var)
             
-            model_name = st.text_input("Model Name", value=getattr(selected_provider, 'model_name', '')) if isinstance(selected_provider, (ContentProvider, ExpressionProvider)) else None
+            model_name = st.text_input("Model Name", value=getattr(selected_provider, 'model_name', '') or '') if isinstance(selected_provider, (ContentProvider, ExpressionProvider, PerceptionProvider)) else None
             voice_id = st.text_input("Provider Voice ID", value=getattr(selected_provider, 'provider_voice_id', '')) if isinstance(selected_provider, AudioProvider) else None
             avatar_id = st.text_input("Provider Avatar/Photo ID", value=getattr(selected_provider, 'provider_avatar_id', '')) if isinstance(selected_provider, VideoProvider) else None
             prompt_template = st.text_area("Base Prompt Template", value=getattr(selected_provider, 'base_prompt_template', '')) if isinstance(selected_provider, ExpressionProvider) else None
             ref_text = st.text_area("Reference Text", value=getattr(selected_provider, 'reference_text', '')) if isinstance(selected_provider, ExpressionProvider) else None
+            asr_backend = st.selectbox("ASR Backend", options=ASR_BACKENDS, index=ASR_BACKENDS.index(selected_provider.asr_backend) if getattr(selected_provider, 'asr_backend', None) in ASR_BACKENDS else 0) if isinstance(selected_provider, PerceptionProvider) else None
+            asr_beam_size = st.number_input("ASR Beam Size (0 = backend default)", min_value=0, value=getattr(selected_provider, 'asr_beam_size', None) or 0) if isinstance(selected_provider, PerceptionProvider) else None
 
             col1, col2 = st.columns([1, 5])
             with col1:
@@ -104,6 +111,8 @@ with st.expander("Edit or Delete Existing Provider"):
                         if avatar_id is not None: selected_provider.provider_avatar_id = avatar_id
                         if prompt_template is not None: selected_provider.base_prompt_template = prompt_template
                         if ref_text is not None: selected_provider.reference_text = ref_text
+                        if asr_backend is not None: selected_provider.asr_backend = asr_backend
+                        if asr_beam_size is not None: selected_provider.asr_beam_size = asr_beam_size or None
                         db.commit()
                         st.success("Provider updated successfully!")
                         st.rerun()
@@ -144,6 +153,8 @@ with st.expander("Create New Avatar"):
         sel_audio_key = st.selectbox("Audio Provider", options=audio_providers.keys())
         sel_video_key = st.selectbox("Video Provider", options=video_providers.keys())
         sel_perc_key = st.selectbox("Perception Provider", options=perception_providers.keys())
+        generation_mode = st.selectbox("Generation Mode", options=GENERATION_MODES, help="'fused' generates content and persona text in a single LLM call.")
+        content_cache_enabled = st.checkbox("Cache Content Responses", help="Reuse the content answer for near-identical questions to this avatar. Content is then generated without user context or history, which the expression stage adds when it rephrases. Suits FAQ-style avatars; not used in fused mode.")
 
         if st.form_submit_button("Create Avatar"):
             try:
@@ -154,7 +165,9 @@ with st.expander("Create New Avatar"):
                     expression_provider_id=expression_providers.get(sel_expr_key),
                     audio_provider_id=audio_providers.get(sel_audio_key),
                     video_provider_id=video_providers.get(sel_video_key),
-                    perception_provider_id=perception_providers.get(sel_perc_key)
+                    perception_provider_id=perception_providers.get(sel_perc_key),
+                    generation_mode=generation_mode,
+                    content_cache_enabled=content_cache_enabled
                 )
                 db.add(new_avatar)
                 db.commit()
@@ -201,6 +214,8 @@ with st.expander("Edit or Delete Existing Avatar"):
             sel_audio = st.selectbox("Audio Provider", options=audio_providers.keys(), index=get_index(audio_providers, selected_avatar.audio_provider_id))
             sel_video = st.selectbox("Video Provider", options=video_providers.keys(), index=get_index(video_providers, selected_avatar.video_provider_id))
             sel_perc = st.selectbox("Perception Provider", options=perception_providers.keys(), index=get_index(perception_providers, selected_avatar.perception_provider_id))
+            generation_mode = st.selectbox("Generation Mode", options=GENERATION_MODES, index=GENERATION_MODES.index(selected_avatar.generation_mode) if selected_avatar.generation_mode in GENERATION_MODES else 0)
+            content_cache_enabled = st.checkbox("Cache Content Responses", value=selected_avatar.content_cache_enabled)
 
             col1, col2 = st.columns([1, 5])
             with col1:
@@ -213,6 +228,8 @@ with st.expander("Edit or Delete Existing Avatar"):
                         selected_avatar.audio_provider_id = audio_providers[sel_audio]
                         selected_avatar.video_provider_id = video_providers[sel_video]
                         selected_avatar.perception_provider_id = perception_providers[sel_perc]
+                        selected_avatar.generation_mode = generation_mode
+                        selected_avatar.content_cache_enabled = content_cache_enabled
                         db.commit()
                         st.success("Avatar updated successfully!")
                         st.rerun()
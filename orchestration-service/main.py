@@ -1,32 +1,66 @@
 import os
 import uvicorn
 import logging
-import httpx
-import boto3
 import asyncio
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+import socket
+import datetime
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from utils.db import get_db, Interaction
+from utils.db import get_db, AsyncSessionLocal, Interaction, OrchestrationJob
+from utils.http import get_http_client, close_http_client, get_http_stats, TIMEOUT_PROFILES
+from utils.notifications import NotificationListener, VIDEO_STATUS_CHANNEL
 
 PERCEPTION_SERVICE_URL = os.getenv("PERCEPTION_SERVICE_URL", "http://perception-service:8000")
 CONVERSATIONAL_SERVICE_URL = os.getenv("CONVERSATIONAL_SERVICE_URL", "http://conversational-service:8000")
 VOCAL_SERVICE_URL = os.getenv("VOCAL_SERVICE_URL", "http://vocal-service:8000")
 EMBODIMENT_SERVICE_URL = os.getenv("EMBODIMENT_SERVICE_URL", "http://embodiment-service:8004")
 
-S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
-S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
-S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
-S3_INPUT_BUCKET_NAME = os.getenv("S3_INPUT_BUCKET_NAME", "inputs")
-
-POLLING_INTERVAL = 10 # seconds
+# Jobs park while their video renders; video completion is pushed via the video status channel,
+# and a sweeper polling the status of parked jobs is only a fallback
+POLLING_INITIAL_INTERVAL = float(os.getenv("POLLING_INITIAL_INTERVAL", "5")) # seconds
+POLLING_MAX_INTERVAL = float(os.getenv("POLLING_MAX_INTERVAL", "60")) # seconds
+POLLING_BACKOFF_FACTOR = float(os.getenv("POLLING_BACKOFF_FACTOR", "2"))
 POLLING_TIMEOUT = 3600 # 1 hour
+VIDEO_SWEEP_INTERVAL = float(os.getenv("VIDEO_SWEEP_INTERVAL", "10")) # seconds between sweeps over parked jobs
+VIDEO_SWEEP_BATCH_SIZE = int(os.getenv("VIDEO_SWEEP_BATCH_SIZE", "50")) # parked jobs polled per sweep
+
+# Durable job queue: every replica runs ORCHESTRATION_WORKERS workers claiming jobs from the orchestration_job table
+ORCHESTRATION_WORKERS = int(os.getenv("ORCHESTRATION_WORKERS", "8"))
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv("JOB_QUEUE_POLL_INTERVAL", "2")) # seconds
+JOB_LEASE_TIMEOUT = int(os.getenv("JOB_LEASE_TIMEOUT", "120")) # seconds without heartbeat before a job is reclaimed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Pipeline stages in execution order; a job resumes after its last_completed_stage
+STAGES = ["perception", "conversation", "vocal", "embodiment", "poll"]
+
+video_status_listener = NotificationListener(VIDEO_STATUS_CHANNEL)
+job_available = asyncio.Event()
+background_tasks = set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_client()
+    video_status_listener.add_handler(on_video_status)
+    await video_status_listener.start()
+    workers = [asyncio.create_task(orchestration_worker(f"{socket.gethostname()}-{os.getpid()}-{i}")) for i in range(ORCHESTRATION_WORKERS)]
+    workers.append(asyncio.create_task(sweep_parked_jobs()))
+    logger.info(f"Started {ORCHESTRATION_WORKERS} orchestration workers and the parked job sweeper.")
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, *background_tasks, return_exceptions=True)
+    await video_status_listener.stop()
+    await close_http_client()
 
 app = FastAPI(
     title="Orchestration Engine",
     description="Manages the end-to-end workflow for generating an avatar response.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,107 +75,334 @@ class OrchestrationResponse(BaseModel):
     interaction_id: int
     message: str = "Orchestration process started."
 
-def get_s3_client():
-    return boto3.client('s3', endpoint_url=S3_ENDPOINT_URL, aws_access_key_id=S3_ACCESS_KEY_ID, aws_secret_access_key=S3_SECRET_ACCESS_KEY)
+async def fetch_video_status(interaction_id: int) -> str | None:
+    """Asks the embodiment service for the current video status (polling fallback)."""
+    try:
+        client = get_http_client()
+        response = await client.get(f"{EMBODIMENT_SERVICE_URL}/v1/status/{interaction_id}", timeout=TIMEOUT_PROFILES["short"])
+        response.raise_for_status()
+        return response.json().get("status")
+    except Exception as e:
+        logger.warning(f"[Interaction {interaction_id}] Status poll failed: {e}")
+        return None
+
+class ClaimedJob(BaseModel):
+    """Plain snapshot of a claimed job, so no ORM session has to outlive the claim."""
+    job_id: int
+    interaction_id: int
+    last_completed_stage: str | None
+    attempts: int
+    worker_id: str
+
+def is_stage_done(job: ClaimedJob, stage: str) -> bool:
+    return job.last_completed_stage is not None and STAGES.index(job.last_completed_stage) >= STAGES.index(stage)
+
+async def checkpoint(job: ClaimedJob, stage: str, **interaction_updates):
+    """Records a finished stage (and any interaction fields it produced) in a short-lived session."""
+    async with AsyncSessionLocal() as db:
+        if interaction_updates:
+            await db.execute(update(Interaction).where(Interaction.interaction_id == job.interaction_id).values(**interaction_updates))
+        await db.execute(update(OrchestrationJob).where(OrchestrationJob.job_id == job.job_id).values(last_completed_stage=stage))
+        await db.commit()
+    job.last_completed_stage = stage
+    logger.info(f"[Interaction {job.interaction_id}] Checkpoint: stage '{stage}' done.")
+
+async def finish_job(job_id: int, interaction_id: int, interaction_status: str, db: AsyncSession, error: str | None = None):
+    await db.execute(update(Interaction).where(Interaction.interaction_id == interaction_id).values(status=interaction_status))
+    await db.execute(update(OrchestrationJob).where(OrchestrationJob.job_id == job_id).values(
+        status="done" if interaction_status == "completed" else "failed",
+        last_error=error,
+        locked_by=None,
+    ))
+    await db.commit()
+
+async def park_job(job: ClaimedJob) -> bool:
+    """
+    Moves a running job to 'awaiting_video' and releases its worker. The attempt counter
+    restarts, since the job got this far; POLLING_TIMEOUT bounds the wait instead.
+    Returns False if the worker no longer held the job.
+    """
+    now = datetime.datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(OrchestrationJob).where(
+                OrchestrationJob.job_id == job.job_id, OrchestrationJob.locked_by == job.worker_id, OrchestrationJob.status == "running"
+            ).values(
+                status="awaiting_video",
+                locked_by=None,
+                attempts=0,
+                awaiting_video_since=func.coalesce(OrchestrationJob.awaiting_video_since, now),
+                next_video_check_at=now + datetime.timedelta(seconds=POLLING_INITIAL_INTERVAL),
+            )
+        )
+        await db.commit()
+    return result.rowcount > 0
+
+async def requeue_parked_job(interaction_id: int):
+    """Puts a parked job back in the queue once its video reached a final status."""
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(OrchestrationJob).where(
+                    OrchestrationJob.interaction_id == interaction_id, OrchestrationJob.status == "awaiting_video"
+                ).values(status="queued", next_video_check_at=None)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"[Interaction {interaction_id}] Failed to requeue parked job: {e}")
+        return
+    if result.rowcount:
+        logger.info(f"[Interaction {interaction_id}] Video finished, job requeued.")
+        job_available.set()
+
+def on_video_status(payload: dict):
+    """Listener handler for video status events; every replica tries, only one requeues the job."""
+    if payload.get("status") not in ("completed", "failed"):
+        return
+    task = asyncio.create_task(requeue_parked_job(payload["interaction_id"]))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+def next_video_check_delay(waited: float) -> float:
+    """Poll interval for a parked job, growing with the time it has waited already."""
+    return min(POLLING_MAX_INTERVAL, max(POLLING_INITIAL_INTERVAL, waited * (POLLING_BACKOFF_FACTOR - 1)))
 
-async def run_orchestration_pipeline(interaction_id: int, db: Session):
-    """The main orchestration logic that runs in the background."""
+async def sweep_parked_jobs():
+    """
+    Fallback for missed status events: polls the video status of parked jobs whose next
+    check is due, requeues those whose video finished and fails those waiting longer
+    than POLLING_TIMEOUT. SKIP LOCKED keeps the sweepers of several replicas apart.
+    """
+    while True:
+        await asyncio.sleep(VIDEO_SWEEP_INTERVAL)
+        try:
+            now = datetime.datetime.utcnow()
+            due = []
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(OrchestrationJob).where(
+                        OrchestrationJob.status == "awaiting_video", OrchestrationJob.next_video_check_at <= now
+                    ).order_by(OrchestrationJob.next_video_check_at.asc()).limit(VIDEO_SWEEP_BATCH_SIZE).with_for_update(skip_locked=True)
+                )
+                for job in result.scalars().all():
+                    waited = (now - (job.awaiting_video_since or now)).total_seconds()
+                    if waited > POLLING_TIMEOUT:
+                        # Failed under the row lock, so a concurrent requeue cannot revive it
+                        logger.error(f"[Interaction {job.interaction_id}] Video not finished after {POLLING_TIMEOUT}s, failing the job.")
+                        await db.execute(update(Interaction).where(Interaction.interaction_id == job.interaction_id).values(status="failed_orchestration"))
+                        job.status, job.last_error, job.next_video_check_at = "failed", "Polling timed out.", None
+                        continue
+                    due.append(job.interaction_id)
+                    job.next_video_check_at = now + datetime.timedelta(seconds=next_video_check_delay(waited))
+                await db.commit()
+
+            statuses = await asyncio.gather(*(fetch_video_status(interaction_id) for interaction_id in due))
+            for interaction_id, status in zip(due, statuses):
+                logger.info(f"[Interaction {interaction_id}] Swept video status: '{status}'")
+                if status in ("completed", "failed"):
+                    await requeue_parked_job(interaction_id)
+        except Exception as e:
+            logger.error(f"Parked job sweep failed: {e}")
+
+async def run_orchestration_pipeline(job: ClaimedJob):
+    """
+    The main orchestration logic, resumed from the job's last completed stage.
+    Database sessions are opened per step and never held across a service call.
+    """
+    interaction_id = job.interaction_id
+    client = get_http_client()
     try:
-        # Step 1: Fetch the newly created interaction
-        interaction = db.query(Interaction).options(joinedload(Interaction.session)).filter(Interaction.interaction_id == interaction_id).one()
-        session = interaction.session
-        user_id = session.user_id
-        avatar_id = session.avatar_id
+        # Step 1: Fetch the interaction
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Interaction).where(Interaction.interaction_id == interaction_id))
+            interaction = result.scalar_one()
+            needs_perception = bool(interaction.user_input_audio_url or interaction.user_input_video_url)
+        if job.last_completed_stage:
+            logger.info(f"[Interaction {interaction_id}] Resuming after stage '{job.last_completed_stage}' (attempt {job.attempts}).")
 
         # Step 2: Perception (if needed)
-        if interaction.user_input_audio_url or interaction.user_input_video_url:
-            logger.info(f"[Interaction {interaction_id}] Calling Perception Service...")
-            
-            async with httpx.AsyncClient(timeout=300.0) as client:
+        if not is_stage_done(job, "perception"):
+            if needs_perception:
+                logger.info(f"[Interaction {interaction_id}] Calling Perception Service...")
+                
                 response = await client.post(
                     f"{PERCEPTION_SERVICE_URL}/v1/analyze", 
-                    json={"interaction_id": interaction.interaction_id}
+                    json={"interaction_id": interaction_id},
+                    timeout=TIMEOUT_PROFILES["extended"]
                 )
                 response.raise_for_status()
                 logger.info(f"[Interaction {interaction_id}] Perception Service response: {response.text}")
-            
-            db.refresh(interaction) 
-            if not interaction.user_input_text:
-                logger.error(f"[Interaction {interaction_id}] No text transcribed from input. Stopping orchestration.")
-                interaction.status = "failed_no_transcription"
-                db.commit()
-                return # End the background task
+                
+                if not response.json().get("transcribed_text"):
+                    logger.error(f"[Interaction {interaction_id}] No text transcribed from input. Stopping orchestration.")
+                    async with AsyncSessionLocal() as db:
+                        await finish_job(job.job_id, interaction_id, "failed_no_transcription", db, error="No text transcribed from input.")
+                    return # End the job
+            await checkpoint(job, "perception")
 
         # Step 3: Conversational
-        logger.info(f"[Interaction {interaction_id}] Calling Conversational Service...")
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(f"{CONVERSATIONAL_SERVICE_URL}/v1/generate-response", json={"interaction_id": interaction.interaction_id})
+        if not is_stage_done(job, "conversation"):
+            logger.info(f"[Interaction {interaction_id}] Calling Conversational Service...")
+            response = await client.post(f"{CONVERSATIONAL_SERVICE_URL}/v1/generate-response", json={"interaction_id": interaction_id}, timeout=TIMEOUT_PROFILES["long"])
             response.raise_for_status()
-        conversation_data = response.json()
-        
-        interaction.raw_content_response = conversation_data.get("raw_content_response")
-        interaction.agent_response_text = conversation_data.get("final_response_text")
-        db.commit()
-        logger.info(f"[Interaction {interaction_id}] Conversation complete. Response: '{interaction.agent_response_text}'")
+            conversation_data = response.json()
+            
+            await checkpoint(
+                job, "conversation",
+                raw_content_response=conversation_data.get("raw_content_response"),
+                agent_response_text=conversation_data.get("final_response_text")
+            )
+            logger.info(f"[Interaction {interaction_id}] Conversation complete. Response: '{conversation_data.get('final_response_text')}'")
 
         # Step 4: Vocal
-        logger.info(f"[Interaction {interaction_id}] Calling Vocal Service...")
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(f"{VOCAL_SERVICE_URL}/v1/synthesize", json={"interaction_id": interaction.interaction_id})
+        if not is_stage_done(job, "vocal"):
+            logger.info(f"[Interaction {interaction_id}] Calling Vocal Service...")
+            response = await client.post(f"{VOCAL_SERVICE_URL}/v1/synthesize", json={"interaction_id": interaction_id}, timeout=TIMEOUT_PROFILES["long"])
             response.raise_for_status()
+            await checkpoint(job, "vocal")
         
         # Step 5: Embodiment
-        logger.info(f"[Interaction {interaction_id}] Calling Embodiment Service...")
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(f"{EMBODIMENT_SERVICE_URL}/v1/generate", json={"interaction_id": interaction.interaction_id})
+        video_reused = False
+        if not is_stage_done(job, "embodiment"):
+            logger.info(f"[Interaction {interaction_id}] Calling Embodiment Service...")
+            response = await client.post(f"{EMBODIMENT_SERVICE_URL}/v1/generate", json={"interaction_id": interaction_id}, timeout=TIMEOUT_PROFILES["long"])
             response.raise_for_status()
+            video_reused = response.json().get("generated_video_key") is not None
+            await checkpoint(job, "embodiment")
 
-        # Step 6: Poll for Video Completion
-        logger.info(f"[Interaction {interaction_id}] Started polling for video completion...")
-        max_attempts = POLLING_TIMEOUT // POLLING_INTERVAL
-        for attempt in range(max_attempts):
-            await asyncio.sleep(POLLING_INTERVAL)
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(f"{EMBODIMENT_SERVICE_URL}/v1/status/{interaction_id}")
-                    response.raise_for_status()
-                
-                status_data = response.json()
-                status = status_data.get("status")
-                logger.info(f"Polling attempt {attempt + 1}/{max_attempts}: Status is '{status}'")
-
-                if status == "completed":
-                    interaction.status = "completed"
-                    db.commit()
-                    logger.info(f"--- Orchestration for Interaction {interaction_id} complete! ---")
-                    return # Exit the background task successfully
-                elif status == "failed":
-                    interaction.status = "failed"
-                    db.commit()
-                    raise Exception("Video generation failed according to status endpoint.")
+        # Step 6: Video Completion (an earlier render of the same audio is available right away).
+        # While the video renders the job is parked and this worker freed; the job is requeued
+        # when the final status is published or the sweeper sees it, and resumes here.
+        if not video_reused:
+            status = await fetch_video_status(interaction_id)
+            if status == "failed":
+                raise Exception("Video generation failed according to embodiment service.")
+            if status != "completed":
+                if await park_job(job):
+                    logger.info(f"[Interaction {interaction_id}] Video still rendering, job parked until it finishes.")
+                else:
+                    logger.warning(f"[Interaction {interaction_id}] Lost the job before parking it.")
+                return
 
-            except Exception as e:
-                interaction.status = "failed"
-                db.commit()
-                logger.error(f"Error during polling: {e}")
-        
-        # If loop finishes without completion
-        raise Exception("Polling timed out.")
+        await checkpoint(job, "poll")
+        async with AsyncSessionLocal() as db:
+            await finish_job(job.job_id, interaction_id, "completed", db)
+        logger.info(f"--- Orchestration for Interaction {interaction_id} complete! ---")
 
     except Exception as e:
         logger.error(f"--- Orchestration FAILED for Interaction {interaction_id}: {e} ---")
+        async with AsyncSessionLocal() as db:
+            try:
+                await finish_job(job.job_id, interaction_id, "failed_orchestration", db, error=str(e))
+            except Exception as db_e:
+                logger.error(f"Failed to even mark interaction as failed: {db_e}")
+                await db.rollback()
+
+async def claim_job(worker_id: str) -> ClaimedJob | None:
+    """
+    Claims the oldest queued job, or a running job whose worker stopped sending
+    heartbeats. SKIP LOCKED lets workers on all replicas claim concurrently.
+    """
+    lease_cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=JOB_LEASE_TIMEOUT)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(OrchestrationJob).where(
+                or_(
+                    OrchestrationJob.status == "queued",
+                    and_(OrchestrationJob.status == "running", OrchestrationJob.locked_at < lease_cutoff)
+                )
+            ).order_by(OrchestrationJob.created_at.asc()).limit(1).with_for_update(skip_locked=True)
+        )
+        job = result.scalars().first()
+        if not job:
+            return None
+
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            logger.error(f"[Interaction {job.interaction_id}] Giving up after {job.attempts} attempts.")
+            await finish_job(job.job_id, job.interaction_id, "failed_orchestration", db, error=f"Exceeded {JOB_MAX_ATTEMPTS} attempts.")
+            return None
+
+        job.status = "running"
+        job.locked_by = worker_id
+        job.locked_at = datetime.datetime.utcnow()
+        job.attempts += 1
+        claimed = ClaimedJob(job_id=job.job_id, interaction_id=job.interaction_id, last_completed_stage=job.last_completed_stage, attempts=job.attempts, worker_id=worker_id)
+        await db.commit()
+    return claimed
+
+async def release_job(job_id: int, worker_id: str):
+    """Hands a running job back to the queue so another worker resumes it right away."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(OrchestrationJob).where(
+                OrchestrationJob.job_id == job_id, OrchestrationJob.locked_by == worker_id, OrchestrationJob.status == "running"
+            ).values(status="queued", locked_by=None)
+        )
+        await db.commit()
+
+async def keep_job_alive(job_id: int, worker_id: str, pipeline: asyncio.Task):
+    """
+    Renews the job lease while the pipeline runs, so other workers do not reclaim it.
+    If another worker already holds the job, the pipeline is cancelled and this returns.
+    """
+    while True:
+        await asyncio.sleep(JOB_LEASE_TIMEOUT / 3)
+        async with AsyncSessionLocal() as db:
+            try:
+                result = await db.execute(
+                    update(OrchestrationJob).where(
+                        OrchestrationJob.job_id == job_id, OrchestrationJob.locked_by == worker_id, OrchestrationJob.status == "running"
+                    ).values(locked_at=datetime.datetime.utcnow())
+                )
+                await db.commit()
+            except Exception as e:
+                logger.error(f"Failed to renew lease for job {job_id}: {e}")
+                await db.rollback()
+                continue
+        if result.rowcount == 0:
+            logger.warning(f"Worker {worker_id} lost the lease for job {job_id}, stopping its pipeline.")
+            pipeline.cancel()
+            return
+
+async def orchestration_worker(worker_id: str):
+    """Claims and runs orchestration jobs until cancelled."""
+    while True:
+        job = None
         try:
-            interaction.status = "failed_orchestration"
-            db.commit()
-        except Exception as db_e:
-            logger.error(f"Failed to even mark interaction as failed: {db_e}")
-            db.rollback()
+            job = await claim_job(worker_id)
+            if job:
+                logger.info(f"[Interaction {job.interaction_id}] Claimed by worker {worker_id}.")
+                pipeline = asyncio.create_task(run_orchestration_pipeline(job))
+                heartbeat = asyncio.create_task(keep_job_alive(job.job_id, worker_id, pipeline))
+                try:
+                    await pipeline
+                except asyncio.CancelledError:
+                    if not heartbeat.done():
+                        raise # the worker itself is being cancelled
+                    # The lease was lost: the job belongs to another worker now and must not be released or finished here
+                    job = None
+                    continue
+                finally:
+                    heartbeat.cancel()
+        except asyncio.CancelledError:
+            if job:
+                await release_job(job.job_id, worker_id)
+            raise
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed to process job: {e}")
+
+        if not job:
+            job_available.clear()
+            try:
+                await asyncio.wait_for(job_available.wait(), timeout=JOB_QUEUE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
 
 @app.post("/v1/orchestrate", response_model=OrchestrationResponse)
-async def orchestrate_interaction(request: OrchestrationRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def orchestrate_interaction(request: OrchestrationRequest, db: AsyncSession = Depends(get_db)):
     """
     Receives an initial request, creates an Interaction record, and
-    triggers the full generation pipeline in the background.
+    enqueues the full generation pipeline as a durable job.
     """
     logger.info(f"Received orchestration request for session_id: {request.session_id}")
 
@@ -153,18 +414,23 @@ async def orchestrate_interaction(request: OrchestrationRequest, background_task
             user_input_video_url=request.input_video_s3_key,
             status="processing"
         )
+        new_interaction.orchestration_job = OrchestrationJob(status="queued")
         db.add(new_interaction)
-        db.commit()
-        db.refresh(new_interaction)
+        await db.commit()
         
-        background_tasks.add_task(run_orchestration_pipeline, new_interaction.interaction_id, db)
+        job_available.set() # Wake an idle local worker; other replicas pick jobs up on their next poll
 
         return OrchestrationResponse(interaction_id=new_interaction.interaction_id)
 
     except Exception as e:
         logger.error(f"Failed to create initial interaction record: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Could not initiate orchestration.")
 
+@app.get("/v1/stats/http")
+async def http_stats():
+    """Returns connection pool statistics of the shared HTTP client."""
+    return get_http_stats()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
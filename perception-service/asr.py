@@ -0,0 +1,86 @@
+import os
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+ASR_CPU_THREADS = int(os.getenv("ASR_CPU_THREADS", "4"))
+ASR_COMPUTE_TYPE = os.getenv("ASR_COMPUTE_TYPE", "int8") # CTranslate2 quantization for faster-whisper
+ASR_VAD_MIN_SILENCE_MS = int(os.getenv("ASR_VAD_MIN_SILENCE_MS", "500"))
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "base")
+
+logger = logging.getLogger(__name__)
+
+class ASRUnavailableError(Exception):
+    """Raised when the requested ASR backend cannot be loaded."""
+
+class ASRBackend(ABC):
+    """Transcribes a file path or a 16 kHz float32 waveform to text."""
+    name = None
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @abstractmethod
+    def transcribe(self, audio, beam_size: int | None = None) -> str:
+        ...
+
+class WhisperBackend(ASRBackend):
+    """The reference openai-whisper implementation."""
+    name = "whisper"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        import whisper
+        import torch
+        torch.set_num_threads(ASR_CPU_THREADS)
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio, beam_size: int | None = None) -> str:
+        options = {"beam_size": beam_size} if beam_size else {}
+        return self.model.transcribe(audio, **options).get("text", "")
+
+class FasterWhisperBackend(ASRBackend):
+    """CTranslate2 Whisper with int8 weights, skipping silence with the Silero VAD."""
+    name = "faster_whisper"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_name, device="cpu", compute_type=ASR_COMPUTE_TYPE, cpu_threads=ASR_CPU_THREADS)
+
+    def transcribe(self, audio, beam_size: int | None = None) -> str:
+        segments, _ = self.model.transcribe(
+            audio,
+            beam_size=beam_size or 5,
+            vad_filter=True,
+            vad_parameters={"min_silence_duration_ms": ASR_VAD_MIN_SILENCE_MS}
+        )
+        # Segments are generated lazily, decoding happens while iterating
+        return "".join(segment.text for segment in segments)
+
+ASR_BACKENDS = {backend.name: backend for backend in (WhisperBackend, FasterWhisperBackend)}
+DEFAULT_ASR_BACKEND = WhisperBackend.name
+
+_loaded_backends: dict[tuple[str, str], ASRBackend] = {}
+_load_locks: dict[tuple[str, str], threading.Lock] = {}
+_load_locks_guard = threading.Lock()
+
+def get_asr_backend(name: str | None = None, model_name: str | None = None) -> ASRBackend:
+    """
+    Returns a loaded backend, loading each (backend, model) pair only once per process.
+    Concurrent callers of a pair that is still loading wait for that load instead of starting their own.
+    """
+    name = name or DEFAULT_ASR_BACKEND
+    model_name = model_name or WHISPER_MODEL_NAME
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{name}'. Available: {', '.join(ASR_BACKENDS)}")
+    key = (name, model_name)
+    if key in _loaded_backends:
+        return _loaded_backends[key]
+    with _load_locks_guard:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    with load_lock:
+        if key not in _loaded_backends:
+            _loaded_backends[key] = ASR_BACKENDS[name](model_name)
+            logger.info(f"Loaded ASR backend '{name}' with model '{model_name}'.")
+    return _loaded_backends[key]
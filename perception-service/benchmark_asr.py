@@ -0,0 +1,66 @@
+"""
+Compares ASR backends by word error rate (WER) and real-time factor (RTF).
+
+The manifest is a tab-separated file with one "<audio path>\t<reference transcript>"
+line per sample. Run it inside the perception container, e.g.:
+
+    python benchmark_asr.py manifest.tsv --backend whisper:base --backend faster_whisper:base --beam-size 5
+"""
+import re
+import time
+import argparse
+import whisper
+
+from asr import get_asr_backend
+
+SAMPLE_RATE = 16000
+
+def normalize_words(text: str) -> list[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+def word_errors(reference: list[str], hypothesis: list[str]) -> int:
+    """Levenshtein distance over words (substitutions + deletions + insertions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, reference_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (reference_word != hypothesis_word)))
+        previous = current
+    return previous[-1]
+
+def load_manifest(path: str) -> list[tuple[str, str]]:
+    with open(path, encoding="utf-8") as manifest:
+        return [tuple(line.rstrip("\n").split("\t", 1)) for line in manifest if line.strip()]
+
+def benchmark(backend_spec: str, samples: list[tuple[str, str]], beam_size: int | None) -> dict:
+    backend_name, _, model_name = backend_spec.partition(":")
+    backend = get_asr_backend(backend_name, model_name or None)
+    errors, reference_words, audio_seconds, processing_seconds = 0, 0, 0.0, 0.0
+    for audio_path, reference in samples:
+        audio = whisper.load_audio(audio_path) # decoded once up front, so only inference is timed
+        started = time.perf_counter()
+        hypothesis = backend.transcribe(audio, beam_size=beam_size)
+        processing_seconds += time.perf_counter() - started
+        audio_seconds += len(audio) / SAMPLE_RATE
+        reference_tokens = normalize_words(reference)
+        errors += word_errors(reference_tokens, normalize_words(hypothesis))
+        reference_words += len(reference_tokens)
+    return {
+        "backend": backend_spec,
+        "wer": errors / reference_words if reference_words else 0.0,
+        "rtf": processing_seconds / audio_seconds if audio_seconds else 0.0,
+        "audio_seconds": audio_seconds,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="TSV file with '<audio path>\\t<reference transcript>' lines.")
+    parser.add_argument("--backend", action="append", required=True, help="Backend as 'name[:model]', may be repeated.")
+    parser.add_argument("--beam-size", type=int, default=None)
+    args = parser.parse_args()
+
+    samples = load_manifest(args.manifest)
+    print(f"{'backend':<32} {'WER':>8} {'RTF':>8} {'audio [s]':>10}")
+    for backend_spec in args.backend:
+        result = benchmark(backend_spec, samples, args.beam_size)
+        print(f"{result['backend']:<32} {result['wer']:>8.2%} {result['rtf']:>8.3f} {result['audio_seconds']:>10.1f}")
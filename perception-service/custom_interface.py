@@ -30,7 +30,13 @@ class CustomEncoderWav2vec2Classifier(torch.nn.Module):
         # This is a method that SpeechBrain's interface expects to exist.
         # It handles loading the audio and making the prediction.
         from speechbrain.dataio.dataio import read_audio
-        wav = read_audio(file_path)
+        return self.classify_waveform(read_audio(file_path))
+
+    def classify_waveform(self, wav):
+        """
+        Classifies an already decoded 16 kHz mono waveform (numpy array or tensor).
+        """
+        wav = torch.as_tensor(wav, dtype=torch.float32)
         wav = wav.unsqueeze(0)
         out = self.forward(wav)
         out = out.squeeze(0)
@@ -1,66 +1,193 @@
 import os
+import time
+import asyncio
 import tempfile
+import threading
+import subprocess
 import uvicorn
 import cv2
 import logging
+import itertools
+import multiprocessing
 import numpy as np
-import boto3
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from botocore.exceptions import BotoCoreError, ClientError
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel, Field
-from moviepy import VideoFileClip
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from utils.db import get_db, Interaction
+from asr import get_asr_backend, ASRUnavailableError, DEFAULT_ASR_BACKEND
+from utils import storage
+from utils.db import get_db, AsyncSessionLocal, Avatar, Interaction, PerceptionProvider, Session as DbSession
 
-try:
-    from deepface import DeepFace
-    print("DeepFace library imported successfully.")
+# Batched face analysis: frames are detected in parallel, then each attribute model runs once per batch
+FACE_BATCH_SIZE = int(os.getenv("FACE_BATCH_SIZE", "16"))
+FACE_DETECTION_THREADS = int(os.getenv("FACE_DETECTION_THREADS", "4"))
+FACE_DETECTOR_BACKEND = os.getenv("FACE_DETECTOR_BACKEND", "opencv")
+# Frame sampling: "fps" samples at a fixed rate, "scene_change" keeps only those samples that differ from the
+# last kept frame, "keyframes" lets ffmpeg decode nothing but keyframes
+FRAME_SAMPLING_STRATEGY = os.getenv("FRAME_SAMPLING_STRATEGY", "fps")
+FRAME_SAMPLING_FPS = float(os.getenv("FRAME_SAMPLING_FPS", "1.0")) # frames per second
+FRAME_MAX_FRAMES = int(os.getenv("FRAME_MAX_FRAMES", "60")) # frames analyzed per clip
+FRAME_SCENE_THRESHOLD = float(os.getenv("FRAME_SCENE_THRESHOLD", "0.3")) # Bhattacharyya distance between colour histograms
+FRAME_SEEK_MIN_INTERVAL = float(os.getenv("FRAME_SEEK_MIN_INTERVAL", "2.0")) # seconds; shorter gaps are skipped with grab()
+# TensorFlow reads its thread pool sizes from the environment when it is first imported
+if os.getenv("FACE_MODEL_THREADS"):
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", os.getenv("FACE_MODEL_THREADS"))
+
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+GENDER_LABELS = ["Woman", "Man"]
+
+AUDIO_EMOTION_MODEL = os.getenv("AUDIO_EMOTION_MODEL", "speechbrain/emotion-recognition-wav2vec2-IEMOCAP")
+
+# Models run in dedicated worker processes ("processes"), one per model family, so Whisper decoding and DeepFace
+# pre- and post-processing do not contend for the API process's GIL; "threads" runs everything in this process
+PERCEPTION_EXECUTION = os.getenv("PERCEPTION_EXECUTION", "processes")
+MODEL_WORKER_PROCESSES = int(os.getenv("MODEL_WORKER_PROCESSES", "1")) # per model family, each loads its own copy
+PERCEPTION_WORKERS = int(os.getenv("PERCEPTION_WORKERS", "4")) # threads for decoding, and for the models in "threads" mode
+
+# Models are loaded by the process that runs them: spawned model workers import this module without loading anything
+DeepFace = None
+face_attribute_models = {}
+audio_emotion_classifier = None
+
+def load_face_models():
+    global DeepFace, face_attribute_models
+    try:
+        from deepface import DeepFace
+        print("DeepFace library imported successfully.")
+    except ImportError:
+        print("DeepFace not found.")
+        return
     try:
         print("Pre-loading DeepFace attribute models...")
-        dummy_image = np.zeros((100, 100, 3), dtype=np.uint8)
-        DeepFace.analyze(dummy_image, actions=['emotion', 'age', 'gender'], enforce_detection=False)
+        for model_name in ("Emotion", "Age", "Gender"):
+            try:
+                model_client = DeepFace.build_model(model_name=model_name, task="facial_attribute")
+            except TypeError: # older DeepFace releases take the model name only
+                model_client = DeepFace.build_model(model_name)
+            face_attribute_models[model_name] = getattr(model_client, "model", model_client) # the underlying Keras model
+        DeepFace.extract_faces(np.zeros((100, 100, 3), dtype=np.uint8), detector_backend=FACE_DETECTOR_BACKEND, enforce_detection=False)
         print("DeepFace models pre-loaded successfully.")
     except Exception as e:
-        print(f"Could not pre-load DeepFace models: {e}.")
-except ImportError:
-    print("DeepFace not found.")
-    DeepFace = None
+        face_attribute_models = {}
+        print(f"Could not pre-load DeepFace models, falling back to per-frame analysis: {e}.")
 
-# SpeechBrain and Whisper model loading
-asr_model = None
-audio_emotion_classifier = None
-try:
-    from speechbrain.inference.interfaces import foreign_class
-    import whisper
-    print("SpeechBrain and Whisper libraries imported successfully.")
+def load_audio_emotion_model():
+    global audio_emotion_classifier
+    try:
+        from speechbrain.inference.interfaces import foreign_class
+        print("SpeechBrain library imported successfully.")
+    except ImportError:
+        print("Could not import SpeechBrain.")
+        return
     try:
-        AUDIO_EMOTION_MODEL = os.getenv("AUDIO_EMOTION_MODEL", "speechbrain/emotion-recognition-wav2vec2-IEMOCAP")
         audio_emotion_classifier = foreign_class(source=AUDIO_EMOTION_MODEL, pymodule_file="custom_interface.py", classname="CustomEncoderWav2vec2Classifier")
         print("SpeechBrain Emotion classifier loaded.")
     except Exception as e:
         print(f"ERROR: Could not load SpeechBrain Emotion model: {e}")
+
+def load_default_asr_backend():
+    """Backends selected by a PerceptionProvider are preloaded in the background after startup."""
     try:
-        WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "base")
-        asr_model = whisper.load_model(WHISPER_MODEL_NAME)
-        print(f"Whisper ASR model ({WHISPER_MODEL_NAME}) loaded.")
+        default_asr_backend = get_asr_backend()
+        print(f"ASR backend '{default_asr_backend.name}' ({default_asr_backend.model_name}) loaded.")
     except Exception as e:
-        print(f"ERROR: Could not load Whisper model: {e}")
-except ImportError:
-    print("Could not import SpeechBrain or Whisper.")
+        print(f"ERROR: Could not load the default ASR backend: {e}")
+
+def load_asr_backend(backend_name: str, model_name: str | None):
+    get_asr_backend(backend_name, model_name) # returns nothing, so no model is sent back from a worker process
+
+face_detection_executor = ThreadPoolExecutor(max_workers=FACE_DETECTION_THREADS, thread_name_prefix="face-detection")
+perception_executor = ThreadPoolExecutor(max_workers=PERCEPTION_WORKERS, thread_name_prefix="perception")
+
+class ModelWorker:
+    """
+    Worker processes that load one model family once and run its inference. Arguments and
+    results are pickled, so stages exchange source URLs, waveforms and small results only.
+    """
+    def __init__(self, name: str, loader):
+        self.name = name
+        self.loader = loader
+        self.executor: ProcessPoolExecutor | None = None
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=MODEL_WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"), initializer=self.loader)
+        self.executor.submit(os.getpid) # starts the processes, so the models load before the first request
+
+    def stop(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, fn, *args)
+        except BrokenProcessPool:
+            logger.error(f"Model worker '{self.name}' died, restarting it.")
+            self.stop()
+            self.start()
+            raise
+
+face_worker = ModelWorker("face", load_face_models)
+audio_emotion_worker = ModelWorker("audio_emotion", load_audio_emotion_model)
+asr_worker = ModelWorker("asr", load_default_asr_backend)
+model_workers = [face_worker, audio_emotion_worker, asr_worker]
 
-S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
-S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
-S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
 S3_INPUT_BUCKET_NAME = os.getenv("S3_INPUT_BUCKET_NAME", "inputs")
+AUDIO_SAMPLE_RATE = 16000 # expected by the wav2vec2 emotion model and Whisper
+# Decoders read inputs from a presigned URL while they download; otherwise inputs are downloaded to a temp file first
+PERCEPTION_STREAM_INPUTS = os.getenv("PERCEPTION_STREAM_INPUTS", "true").lower() == "true"
+PERCEPTION_READ_TIMEOUT = float(os.getenv("PERCEPTION_READ_TIMEOUT", "30")) # seconds a decoder waits for input data
+PERCEPTION_DECODE_TIMEOUT = float(os.getenv("PERCEPTION_DECODE_TIMEOUT", "300")) # seconds per decoder process
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def preload_provider_asr_backends():
+    """Loads the ASR backends of all perception providers, so their first request does not wait for the model."""
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(PerceptionProvider))
+            specs = {(provider.asr_backend or DEFAULT_ASR_BACKEND, provider.model_name) for provider in result.scalars()}
+    except Exception as e:
+        logger.warning(f"Could not read perception providers to preload ASR backends: {e}")
+        return
+    loop = asyncio.get_running_loop()
+    for backend_name, model_name in specs:
+        try:
+            if asr_worker.executor:
+                await asr_worker.run(load_asr_backend, backend_name, model_name)
+            else:
+                await loop.run_in_executor(None, load_asr_backend, backend_name, model_name)
+        except Exception as e:
+            logger.warning(f"Could not preload ASR backend '{backend_name}' ({model_name}): {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PERCEPTION_EXECUTION == "processes":
+        for worker in model_workers:
+            worker.start()
+    else:
+        for worker in model_workers:
+            worker.loader()
+    preload = asyncio.create_task(preload_provider_asr_backends())
+    yield
+    preload.cancel()
+    for worker in model_workers:
+        worker.stop()
 
 app = FastAPI(
     title="Perception Engine",
     description="Analyzes files from S3 based on an interaction ID and updates the database.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
 class PerceptionRequest(BaseModel):
     interaction_id: int = Field(..., description="The ID of the interaction to be processed.")
@@ -70,44 +197,168 @@ class PerceptionResponse(BaseModel):
     status: str = "perception_complete"
     transcribed_text: str | None
     perceived_user_affect: str | None
+    timings: dict[str, float] = Field(default_factory=dict, description="Duration of each perception stage in seconds.")
+
+def decode_audio(source: str) -> np.ndarray | None:
+    """
+    Decodes the audio track of any audio or video file or URL once, with a single
+    ffmpeg process, into the 16 kHz mono float32 waveform all audio models consume.
+    Raises TimeoutError if the input stalls or decoding exceeds PERCEPTION_DECODE_TIMEOUT.
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-rw_timeout", str(int(PERCEPTION_READ_TIMEOUT * 1e6)), "-i", source,
+        "-vn", "-f", "f32le", "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE), "-"
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, check=True, timeout=PERCEPTION_DECODE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise TimeoutError(f"Audio decoding did not finish within {PERCEPTION_DECODE_TIMEOUT} seconds.")
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"Failed to decode audio: {getattr(e, 'stderr', b'').decode(errors='ignore') or e}")
+        return None
+    waveform = np.frombuffer(result.stdout, dtype=np.float32)
+    return waveform if waveform.size else None
 
-def get_s3_client():
-    return boto3.client('s3', endpoint_url=S3_ENDPOINT_URL, aws_access_key_id=S3_ACCESS_KEY_ID, aws_secret_access_key=S3_SECRET_ACCESS_KEY)
+def resize_face(face: np.ndarray, target_size: tuple[int, int] = (224, 224)) -> np.ndarray:
+    """Scales a face crop into the target size keeping its aspect ratio and pads the rest, like DeepFace does."""
+    factor = min(target_size[0] / face.shape[0], target_size[1] / face.shape[1])
+    resized = cv2.resize(face, (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor))))
+    pad_height, pad_width = target_size[0] - resized.shape[0], target_size[1] - resized.shape[1]
+    padded = np.pad(resized, ((pad_height // 2, pad_height - pad_height // 2), (pad_width // 2, pad_width - pad_width // 2), (0, 0)), "constant")
+    return padded.astype(np.float32)
 
-def extract_audio_from_video(video_path: str) -> str:
+def detect_face(frame: np.ndarray) -> np.ndarray | None:
+    """Returns the first face of a frame as a 224x224 BGR crop in [0, 1], or None."""
     try:
-        video_clip = VideoFileClip(video_path)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio_file:
-            audio_path = temp_audio_file.name
-        video_clip.audio.write_audiofile(audio_path, codec='pcm_s16le', fps=16000)
-        video_clip.close()
-        return audio_path
-    except Exception as e:
-        logger.error(f"Failed to extract audio from video: {e}")
+        faces = DeepFace.extract_faces(frame, detector_backend=FACE_DETECTOR_BACKEND, enforce_detection=False, align=True)
+        return resize_face(faces[0]["face"][:, :, ::-1]) if faces else None # extract_faces returns RGB
+    except Exception:
         return None
 
-def analyze_video_frames(video_path: str) -> dict:
+def analyze_face_batch(frames: list[np.ndarray]) -> list[tuple[str, float, str]]:
+    """Detects faces in a batch of frames and runs each attribute model once over all crops."""
+    crops = [crop for crop in face_detection_executor.map(detect_face, frames) if crop is not None]
+    if not crops: return []
+    batch = np.stack(crops)
+    gray_batch = np.stack([cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), (48, 48)) for crop in crops])[..., np.newaxis]
+
+    emotion_scores = face_attribute_models["Emotion"].predict(gray_batch, verbose=0)
+    age_scores = face_attribute_models["Age"].predict(batch, verbose=0)
+    gender_scores = face_attribute_models["Gender"].predict(batch, verbose=0)
+    ages = age_scores @ np.arange(age_scores.shape[1]) # apparent age is the expectation over the age buckets
+    return [
+        (EMOTION_LABELS[int(np.argmax(emotion))], float(age), GENDER_LABELS[int(np.argmax(gender))])
+        for emotion, age, gender in zip(emotion_scores, ages, gender_scores)
+    ]
+
+def analyze_frame(frame: np.ndarray) -> list[tuple[str, float, str]]:
+    """Per-frame analysis, used when the attribute models could not be loaded for batching."""
+    try:
+        analysis = DeepFace.analyze(frame, actions=['emotion', 'age', 'gender'], enforce_detection=False)
+        if isinstance(analysis, list) and analysis:
+            face_data = analysis[0]
+            return [(face_data.get('dominant_emotion'), face_data.get('age'), face_data.get('dominant_gender'))]
+    except Exception: pass
+    return []
+
+def sample_frames_at_interval(cap: cv2.VideoCapture, frame_rate: float, interval: float):
+    """
+    Yields one frame every `interval` seconds. Only sampled frames are retrieved and converted to pixels:
+    long gaps are seeked over (which decodes from the preceding keyframe), short ones are skipped with grab().
+    """
+    frame_step = max(1, round(frame_rate * interval))
+    seek = interval >= FRAME_SEEK_MIN_INTERVAL
+    position = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret: return
+        yield frame
+        position += frame_step
+        if seek and cap.set(cv2.CAP_PROP_POS_FRAMES, position): continue
+        seek = False # the source is not seekable, fall back to grabbing
+        for _ in range(frame_step - 1):
+            if not cap.grab(): return
+
+def sample_keyframes(video_source: str, width: int, height: int, max_frames: int):
+    """Yields the keyframes of a video, decoded by ffmpeg with all other frames skipped before decoding."""
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-rw_timeout", str(int(PERCEPTION_READ_TIMEOUT * 1e6)),
+        "-skip_frame", "nokey", "-i", video_source,
+        "-an", "-vsync", "vfr", "-frames:v", str(max_frames), "-vf", f"scale={width}:{height}",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-"
+    ]
+    frame_size = width * height * 3
+    try:
+        with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+            deadline = threading.Timer(PERCEPTION_DECODE_TIMEOUT, process.kill) # ends the frame stream, keeping the frames read so far
+            deadline.start()
+            try:
+                while len(data := process.stdout.read(frame_size)) == frame_size:
+                    yield np.frombuffer(data, np.uint8).reshape(height, width, 3)
+            finally:
+                deadline.cancel()
+                process.kill()
+    except OSError as e:
+        logger.error(f"Could not run ffmpeg for keyframe sampling: {e}")
+
+def filter_scene_changes(frames, threshold: float):
+    """Keeps the first frame and every frame whose colour histogram (hue and brightness) differs enough from the last kept one."""
+    previous = None
+    for frame in frames:
+        small = cv2.cvtColor(cv2.resize(frame, (64, 36)), cv2.COLOR_BGR2HSV)
+        histogram = cv2.normalize(cv2.calcHist([small], [0, 2], None, [16, 16], [0, 180, 0, 256]), None).flatten()
+        if previous is None or cv2.compareHist(previous, histogram, cv2.HISTCMP_BHATTACHARYYA) >= threshold:
+            previous = histogram
+            yield frame
+
+def sample_video_frames(cap: cv2.VideoCapture, video_source: str):
+    """Yields at most FRAME_MAX_FRAMES frames, chosen by FRAME_SAMPLING_STRATEGY."""
+    frame_rate = cap.get(cv2.CAP_PROP_FPS) or 30
+    if FRAME_SAMPLING_STRATEGY == "keyframes":
+        ret, first_frame = cap.read() # gives the frame size after rotation, which ffmpeg applies as well
+        if not ret: return
+        height, width = first_frame.shape[:2]
+        yield from sample_keyframes(video_source, width, height, FRAME_MAX_FRAMES)
+        return
+
+    interval = 1 / FRAME_SAMPLING_FPS
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / frame_rate # 0 when the container does not tell
+    if FRAME_SAMPLING_STRATEGY != "scene_change" and duration > 0:
+        interval = max(interval, duration / FRAME_MAX_FRAMES) # spread the budget over the whole clip
+    frames = sample_frames_at_interval(cap, frame_rate, interval)
+    if FRAME_SAMPLING_STRATEGY == "scene_change":
+        frames = filter_scene_changes(frames, FRAME_SCENE_THRESHOLD)
+    yield from itertools.islice(frames, FRAME_MAX_FRAMES)
+
+def analyze_video_frames(video_source: str) -> dict:
     if not DeepFace: return {}
-    cap = cv2.VideoCapture(video_path)
+    timeout_ms = int(PERCEPTION_READ_TIMEOUT * 1000)
+    cap = cv2.VideoCapture(video_source, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
     if not cap.isOpened(): return {}
-    frame_rate = cap.get(cv2.CAP_PROP_FPS) or 30
-    frame_interval = int(frame_rate)
-    all_emotions, all_ages, all_genders = [], [], []
-    frame_count = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret: break
-        if frame_count % frame_interval == 0:
+    results, batch = [], []
+
+    def flush():
+        if face_attribute_models:
             try:
-                analysis = DeepFace.analyze(frame, actions=['emotion', 'age', 'gender'], enforce_detection=False)
-                if isinstance(analysis, list) and analysis:
-                    face_data = analysis[0]
-                    all_emotions.append(face_data.get('dominant_emotion'))
-                    all_ages.append(face_data.get('age'))
-                    all_genders.append(face_data.get('dominant_gender'))
-            except Exception: pass
-        frame_count += 1
-    cap.release()
+                results.extend(analyze_face_batch(batch))
+            except Exception as e:
+                logger.warning(f"Batched face analysis failed, analyzing frames one by one: {e}")
+                for frame in batch: results.extend(analyze_frame(frame))
+        else:
+            for frame in batch: results.extend(analyze_frame(frame))
+        batch.clear()
+
+    try:
+        for frame in sample_video_frames(cap, video_source):
+            batch.append(frame)
+            if len(batch) >= FACE_BATCH_SIZE: flush()
+    finally:
+        cap.release()
+    if batch: flush()
+
+    all_emotions = [emotion for emotion, _, _ in results if emotion]
+    all_ages = [age for _, age, _ in results if age is not None]
+    all_genders = [gender for _, _, gender in results if gender]
     if not all_emotions: return {}
     return {
         "video_emotion": Counter(all_emotions).most_common(1)[0][0] if all_emotions else None,
@@ -115,78 +366,131 @@ def analyze_video_frames(video_path: str) -> dict:
         "gender": Counter(all_genders).most_common(1)[0][0] if all_genders else None
     }
 
-def analyze_audio_emotion(file_path: str) -> str:
+def analyze_audio_emotion(waveform: np.ndarray) -> str:
     if not audio_emotion_classifier: return "Unknown"
     try:
-        _, _, _, text_lab = audio_emotion_classifier.classify_file(file_path)
+        _, _, _, text_lab = audio_emotion_classifier.classify_waveform(waveform)
         emotion = text_lab[0] if isinstance(text_lab, list) else text_lab
         emotion_map = {'neu': 'Neutral', 'ang': 'Angry', 'hap': 'Happy', 'sad': 'Sadness'}
         return emotion_map.get(emotion.lower(), 'Unknown')
     except Exception: return "Unknown"
 
-def transcribe_audio_with_whisper(file_path: str) -> str:
-    if not asr_model: raise HTTPException(status_code=501, detail="Whisper ASR model not loaded.")
+def transcribe_audio(waveform: np.ndarray, backend_name: str, model_name: str | None, beam_size: int | None) -> str:
     try:
-        result = asr_model.transcribe(file_path)
-        return result.get("text", "")
+        backend = get_asr_backend(backend_name, model_name)
+    except Exception as e:
+        logger.error(f"Could not load ASR backend '{backend_name}': {e}")
+        raise ASRUnavailableError(f"ASR backend '{backend_name}' not available.")
+    try:
+        return backend.transcribe(waveform, beam_size=beam_size)
     except Exception: return ""
 
+async def run_stage(name: str, timings: dict, fn, *args, worker: ModelWorker | None = None):
+    """Runs a blocking perception stage on its model worker (or the perception executor) and records its duration."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        if worker and worker.executor:
+            return await worker.run(fn, *args)
+        return await loop.run_in_executor(perception_executor, fn, *args)
+    finally:
+        timings[name] = round(time.perf_counter() - started, 3)
+
+async def analyze_audio(source: str, perception_provider: PerceptionProvider | None, timings: dict) -> tuple[str, str | None]:
+    """Decodes the audio once, then runs audio emotion recognition and transcription side by side on the same waveform."""
+    waveform = await run_stage("audio_decoding", timings, decode_audio, source)
+    if waveform is None: return "Unknown", None
+    backend_name = (perception_provider.asr_backend if perception_provider else None) or DEFAULT_ASR_BACKEND
+    model_name = perception_provider.model_name if perception_provider else None
+    beam_size = perception_provider.asr_beam_size if perception_provider else None
+    try:
+        return await asyncio.gather(
+            run_stage("audio_emotion", timings, analyze_audio_emotion, waveform, worker=audio_emotion_worker),
+            run_stage("transcription", timings, transcribe_audio, waveform, backend_name, model_name, beam_size, worker=asr_worker)
+        )
+    except ASRUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
 @app.post("/v1/analyze", response_model=PerceptionResponse)
-async def analyze_input(request: PerceptionRequest, db: Session = Depends(get_db)):
+async def analyze_input(request: PerceptionRequest, db: AsyncSession = Depends(get_db)):
     """
     Fetches file keys from the database based on an interaction_id,
-    performs analysis, and updates the database record.
+    performs analysis, and updates the database record. The face, audio
+    emotion and speech models run concurrently.
     """
     logger.info(f"Received request to analyze interaction_id: {request.interaction_id}")
     
-    interaction = db.query(Interaction).filter(Interaction.interaction_id == request.interaction_id).first()
+    result = await db.execute(select(Interaction).options(
+        joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.perception_provider)
+    ).where(Interaction.interaction_id == request.interaction_id))
+    interaction = result.scalars().first()
     if not interaction:
         raise HTTPException(status_code=404, detail="Interaction not found.")
+    perception_provider = interaction.session.avatar.perception_provider if interaction.session and interaction.session.avatar else None
+    # End the read transaction, so no pooled connection sits idle during download and inference
+    await db.commit()
 
-    video_path, audio_path, extracted_audio_path = None, None, None
+    temp_paths = []
     transcribed_text, affect_parts = None, []
-    
-    s3_client = get_s3_client()
-    if not s3_client: raise HTTPException(status_code=500, detail="S3 client not available.")
+    video_analysis, audio_emotion = {}, "Unknown"
+    timings = {}
+    started = time.perf_counter()
 
     try:
+        input_key = interaction.user_input_video_url or interaction.user_input_audio_url
+        source = None
+        try:
+            if input_key and PERCEPTION_STREAM_INPUTS:
+                # Decoders cannot tell a missing object from an empty one, so its existence is checked first
+                await storage.head_object(S3_INPUT_BUCKET_NAME, input_key)
+                # ffmpeg and OpenCV read the object over HTTP, so decoding starts with the first bytes
+                source = storage.presigned_get_url(S3_INPUT_BUCKET_NAME, input_key)
+            elif input_key:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4" if interaction.user_input_video_url else ".wav") as temp_file:
+                    temp_paths.append(temp_file.name)
+                    await storage.download_fileobj(S3_INPUT_BUCKET_NAME, input_key, temp_file)
+                    source = temp_file.name
+                timings["download"] = round(time.perf_counter() - started, 3)
+        except ClientError as e:
+            raise HTTPException(status_code=404, detail=f"Input file not found in S3: {e}")
+        except BotoCoreError as e:
+            raise HTTPException(status_code=502, detail=f"Could not reach S3: {e}")
+
         if interaction.user_input_video_url:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
-                s3_client.download_fileobj(S3_INPUT_BUCKET_NAME, interaction.user_input_video_url, temp_file)
-                video_path = temp_file.name
-            video_analysis = analyze_video_frames(video_path)
-            if video_analysis:
-                if video_analysis.get("video_emotion"): affect_parts.append(f"Visually, the user appears {video_analysis['video_emotion']}.")
-                if video_analysis.get("age"): affect_parts.append(f"They seem to be around {video_analysis['age']} years old.")
-                if video_analysis.get("gender"): affect_parts.append(f"Their perceived gender is {video_analysis['gender']}.")
-            extracted_audio_path = extract_audio_from_video(video_path)
-            audio_path = extracted_audio_path
-        
+            # Face analysis runs while the audio track is decoded, classified and transcribed
+            video_analysis, (audio_emotion, transcribed_text) = await asyncio.gather(
+                run_stage("face_analysis", timings, analyze_video_frames, source, worker=face_worker),
+                analyze_audio(source, perception_provider, timings)
+            )
         elif interaction.user_input_audio_url:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-                s3_client.download_fileobj(S3_INPUT_BUCKET_NAME, interaction.user_input_audio_url, temp_file)
-                audio_path = temp_file.name
-
-        if audio_path:
-            audio_emotion = analyze_audio_emotion(audio_path)
-            if audio_emotion != "Unknown":
-                affect_parts.append(f"Vocally, their tone sounds {audio_emotion}.")
-            transcribed_text = transcribe_audio_with_whisper(audio_path)
-    
+            audio_emotion, transcribed_text = await analyze_audio(source, perception_provider, timings)
+
+    except TimeoutError as e:
+        logger.error(f"Reading the input of interaction {request.interaction_id} timed out: {e}")
+        raise HTTPException(status_code=504, detail="Timed out reading the input file.")
     finally:
-        if video_path: os.remove(video_path)
-        if audio_path: os.remove(audio_path)
+        for path in temp_paths: os.remove(path)
+
+    if video_analysis:
+        if video_analysis.get("video_emotion"): affect_parts.append(f"Visually, the user appears {video_analysis['video_emotion']}.")
+        if video_analysis.get("age"): affect_parts.append(f"They seem to be around {video_analysis['age']} years old.")
+        if video_analysis.get("gender"): affect_parts.append(f"Their perceived gender is {video_analysis['gender']}.")
+    if audio_emotion != "Unknown":
+        affect_parts.append(f"Vocally, their tone sounds {audio_emotion}.")
+    timings["total"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Perception timings for interaction {request.interaction_id}: {timings}")
 
     # Update the interaction record in the database
     interaction.user_input_text = transcribed_text
     interaction.perceived_user_affect = " ".join(affect_parts) if affect_parts else None
-    db.commit()
+    await db.commit()
     logger.info(f"Updated interaction {request.interaction_id} with perception data.")
 
     return PerceptionResponse(
         interaction_id=request.interaction_id,
         transcribed_text=transcribed_text,
-        perceived_user_affect=interaction.perceived_user_affect
+        perceived_user_affect=interaction.perceived_user_affect,
+        timings=timings
     )
 
 if __name__ == "__main__":
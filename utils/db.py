@@ -1,7 +1,9 @@
 import os
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship, sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 Base = declarative_base()
 
@@ -12,16 +14,39 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "eca_prototype")
 
 DB_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-engine = create_engine(DB_URL)
+SYNC_DB_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DB_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30")) # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # seconds before a connection is replaced
+
+engine = create_engine(
+    SYNC_DB_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+# The FastAPI services use the asyncio engine so queries do not block the event loop;
+# the synchronous engine above remains for the Streamlit frontend and db-init.
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 class Provider(Base):
     __tablename__ = 'provider'
@@ -55,6 +80,8 @@ class ContentProvider(Provider):
 
 class PerceptionProvider(Provider):
     __mapper_args__ = {'polymorphic_identity': 'perception_provider'}
+    asr_backend = Column(String(50)) # whisper (default) or faster_whisper; model_name selects the ASR model
+    asr_beam_size = Column(Integer)
 
 class Memory(Base):
     __tablename__ = 'memory'
@@ -62,6 +89,7 @@ class Memory(Base):
     memory_type = Column(String(50))
     memory_key = Column(String(255), nullable=False)
     memory_value = Column(Text)
+    embedding = Column(ARRAY(Float), nullable=True) # embedding of "memory_key: memory_value", used for relevance ranking
     last_updated = Column(DateTime, default=datetime.datetime.utcnow)
     __mapper_args__ = {'polymorphic_identity': 'memory', 'polymorphic_on': memory_type}
 
@@ -75,6 +103,10 @@ class AvatarMemory(Memory):
     avatar_id = Column(Integer, ForeignKey('avatar.avatar_id'))
     avatar = relationship("Avatar", back_populates="memories")
 
+# One row per owner and memory_key, so extraction can upsert instead of appending duplicates
+user_memory_key_index = Index('uq_memory_user_key', UserMemory.user_id, UserMemory.memory_key, unique=True, postgresql_where=UserMemory.user_id.isnot(None))
+avatar_memory_key_index = Index('uq_memory_avatar_key', AvatarMemory.avatar_id, AvatarMemory.memory_key, unique=True, postgresql_where=AvatarMemory.avatar_id.isnot(None))
+
 class User(Base):
     __tablename__ = 'user'
     user_id = Column(Integer, primary_key=True)
@@ -95,6 +127,8 @@ class Avatar(Base):
     expression_provider_id = Column(Integer, ForeignKey('provider.provider_id'))
     content_provider_id = Column(Integer, ForeignKey('provider.provider_id'))
     perception_provider_id = Column(Integer, ForeignKey('provider.provider_id'))
+    generation_mode = Column(String(50), default='two_stage', server_default='two_stage', nullable=False) # two_stage, fused
+    content_cache_enabled = Column(Boolean, default=False, server_default='false', nullable=False) # reuse content for near-identical questions
     audio_provider = relationship("AudioProvider", foreign_keys=[audio_provider_id])
     video_provider = relationship("VideoProvider", foreign_keys=[video_provider_id])
     expression_provider = relationship("ExpressionProvider", foreign_keys=[expression_provider_id])
@@ -110,6 +144,8 @@ class Session(Base):
     avatar_id = Column(Integer, ForeignKey('avatar.avatar_id'))
     start_time = Column(DateTime, default=datetime.datetime.utcnow)
     end_time = Column(DateTime)
+    history_summary = Column(Text) # running summary of the turns folded out of the verbatim history window
+    summarized_interaction_id = Column(Integer) # last interaction included in history_summary
     user = relationship("User", back_populates="sessions")
     avatar = relationship("Avatar", back_populates="sessions")
     interactions = relationship("Interaction", back_populates="session", cascade="all, delete-orphan")
@@ -128,5 +164,75 @@ class Interaction(Base):
     raw_content_response = Column(Text)
     agent_response_text = Column(Text)
     generated_audio_url = Column(String(255))
+    generated_audio_sha256 = Column(String(64)) # content hash of the generated audio, used to reuse rendered videos
     generated_video_url = Column(String(255))
     session = relationship("Session", back_populates="interactions")
+    orchestration_job = relationship("OrchestrationJob", back_populates="interaction", uselist=False, cascade="all, delete-orphan")
+    audio_segments = relationship("AudioSegment", back_populates="interaction", cascade="all, delete-orphan", order_by="AudioSegment.segment_index")
+    memory_extraction_job = relationship("MemoryExtractionJob", back_populates="interaction", uselist=False, cascade="all, delete-orphan")
+
+class OrchestrationJob(Base):
+    __tablename__ = 'orchestration_job'
+    job_id = Column(Integer, primary_key=True)
+    interaction_id = Column(Integer, ForeignKey('interaction.interaction_id', ondelete='CASCADE'), unique=True, nullable=False)
+    status = Column(String(50), default='queued', nullable=False, index=True) # queued, running, awaiting_video, done, failed
+    last_completed_stage = Column(String(50), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    locked_by = Column(String(255), nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    awaiting_video_since = Column(DateTime, nullable=True) # when the job first parked to wait for its render
+    next_video_check_at = Column(DateTime, nullable=True) # when the sweeper polls the render status of a parked job next
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    interaction = relationship("Interaction", back_populates="orchestration_job")
+
+class TtsCacheEntry(Base):
+    __tablename__ = 'tts_cache_entry'
+    cache_key = Column(String(64), primary_key=True) # sha256 of provider, voice and normalized text
+    provider_endpoint = Column(String(255), nullable=False)
+    provider_voice_id = Column(String(255))
+    s3_key = Column(String(255), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    audio_sha256 = Column(String(64))
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class VideoRenderCache(Base):
+    __tablename__ = 'video_render_cache'
+    __table_args__ = (UniqueConstraint('audio_sha256', 'provider_avatar_id', 'width', 'height'),)
+    video_render_cache_id = Column(Integer, primary_key=True)
+    audio_sha256 = Column(String(64), nullable=False)
+    provider_avatar_id = Column(String(255), nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    audio_asset_id = Column(String(255), nullable=False)
+    provider_video_id = Column(String(255), nullable=True, index=True) # latest render started from the asset
+    video_s3_key = Column(String(255), nullable=True) # set once a render finished and was stored
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class MemoryExtractionJob(Base):
+    __tablename__ = 'memory_extraction_job'
+    job_id = Column(Integer, primary_key=True)
+    interaction_id = Column(Integer, ForeignKey('interaction.interaction_id', ondelete='CASCADE'), unique=True, nullable=False) # idempotency key
+    status = Column(String(50), default='queued', nullable=False, index=True) # queued, running, done, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    locked_by = Column(String(255), nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    interaction = relationship("Interaction", back_populates="memory_extraction_job")
+
+class AudioSegment(Base):
+    __tablename__ = 'audio_segment'
+    __table_args__ = (UniqueConstraint('interaction_id', 'segment_index'),)
+    audio_segment_id = Column(Integer, primary_key=True)
+    interaction_id = Column(Integer, ForeignKey('interaction.interaction_id', ondelete='CASCADE'), nullable=False, index=True)
+    segment_index = Column(Integer, nullable=False)
+    segment_text = Column(Text, nullable=False)
+    audio_url = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    interaction = relationship("Interaction", back_populates="audio_segments")
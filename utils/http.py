@@ -0,0 +1,122 @@
+import os
+import asyncio
+import logging
+import httpx
+from collections import defaultdict
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")) # seconds
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")) # seconds
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true" # negotiated via ALPN, so only used by TLS upstreams
+
+# Per-call timeout profiles, passed as `timeout=TIMEOUT_PROFILES[...]`
+TIMEOUT_PROFILES = {
+    "short": httpx.Timeout(30.0, connect=HTTP_CONNECT_TIMEOUT),
+    "default": httpx.Timeout(60.0, connect=HTTP_CONNECT_TIMEOUT),
+    "long": httpx.Timeout(120.0, connect=HTTP_CONNECT_TIMEOUT),
+    "extended": httpx.Timeout(300.0, connect=HTTP_CONNECT_TIMEOUT),
+}
+
+logger = logging.getLogger(__name__)
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Wraps a response body and releases the host slot once the body is closed."""
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Connection-pooling transport that additionally caps concurrent requests
+    per upstream host and counts requests for the stats endpoint.
+    """
+    def __init__(self, max_per_host: int, **transport_kwargs):
+        self._transport = httpx.AsyncHTTPTransport(**transport_kwargs)
+        self._max_per_host = max_per_host
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self.requests = defaultdict(int)
+        self.in_flight = defaultdict(int)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode()
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self._max_per_host))
+        await semaphore.acquire()
+        self.requests[host] += 1
+        self.in_flight[host] += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight[host] -= 1
+                semaphore.release()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def stats(self) -> dict:
+        pool = self._transport._pool # httpcore connection pool behind the httpx transport
+        connections = [{"info": connection.info(), "idle": connection.is_idle()} for connection in pool.connections]
+        return {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c["idle"]),
+            "connections": connections,
+            "requests_per_host": dict(self.requests),
+            "in_flight_per_host": {host: n for host, n in self.in_flight.items() if n},
+        }
+
+_transport: HostLimitedTransport | None = None
+_client: httpx.AsyncClient | None = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the process-wide pooled client, creating it on first use."""
+    global _client, _transport
+    if _client is None:
+        _transport = HostLimitedTransport(
+            max_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _client = httpx.AsyncClient(transport=_transport, timeout=TIMEOUT_PROFILES["default"])
+        logger.info("Created shared HTTP client.")
+    return _client
+
+async def close_http_client():
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()
+        _client, _transport = None, None
+
+def get_http_stats() -> dict:
+    if _transport is None:
+        return {"open_connections": 0, "idle_connections": 0, "connections": [], "requests_per_host": {}, "in_flight_per_host": {}}
+    return _transport.stats()
@@ -0,0 +1,95 @@
+import json
+import asyncio
+import logging
+import asyncpg
+from sqlalchemy import text
+
+from utils.db import DB_URL
+
+VIDEO_STATUS_CHANNEL = "video_status"
+RECONNECT_DELAY = 5 # seconds
+
+logger = logging.getLogger(__name__)
+
+async def publish(db, channel: str, payload: dict):
+    """Sends a JSON payload to all listeners of a Postgres NOTIFY channel."""
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": json.dumps(payload)})
+    await db.commit()
+
+class NotificationListener:
+    """
+    Listens on a Postgres NOTIFY channel and fans incoming payloads out to
+    in-process subscribers, keyed by the payload's interaction_id, and to
+    handlers that receive every payload.
+    """
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._conn = None
+        self._reconnect_task = None
+        self._stopping = False
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._handlers = []
+
+    async def start(self):
+        try:
+            self._conn = await asyncpg.connect(DB_URL)
+            await self._conn.add_listener(self.channel, self._on_notification)
+            self._conn.add_termination_listener(self._on_termination)
+            logger.info(f"Listening for notifications on channel '{self.channel}'.")
+        except Exception as e:
+            logger.error(f"Could not listen on channel '{self.channel}', retrying in {RECONNECT_DELAY}s: {e}")
+            self._conn = None
+            self._schedule_reconnect()
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+    def _schedule_reconnect(self):
+        async def reconnect():
+            await asyncio.sleep(RECONNECT_DELAY)
+            await self.start()
+        self._reconnect_task = asyncio.ensure_future(reconnect())
+
+    def _on_termination(self, connection):
+        if self._stopping:
+            return
+        logger.error(f"Lost connection for channel '{self.channel}'.")
+        self._conn = None
+        self._schedule_reconnect()
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            self.dispatch(json.loads(payload))
+        except ValueError:
+            logger.warning(f"Ignoring malformed notification on '{self.channel}': {payload}")
+
+    def dispatch(self, payload: dict):
+        for queue in self._subscribers.get(payload.get("interaction_id"), ()):
+            queue.put_nowait(payload)
+        for handler in self._handlers:
+            handler(payload)
+
+    def add_handler(self, handler):
+        """Registers a callback for every payload; it runs on the event loop and must not block."""
+        self._handlers.append(handler)
+
+    def subscribe(self, interaction_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(interaction_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, interaction_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(interaction_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[interaction_id]
+
+    @property
+    def pending(self) -> int:
+        return len(self._subscribers)
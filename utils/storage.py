@@ -0,0 +1,141 @@
+import os
+import asyncio
+import functools
+import logging
+import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_MAX_WORKERS = int(os.getenv("S3_MAX_WORKERS", "8")) # concurrent blocking S3 calls per process
+S3_STREAM_CHUNK_SIZE = int(os.getenv("S3_STREAM_CHUNK_SIZE", str(1024 * 1024))) # bytes
+S3_MULTIPART_PART_SIZE = max(int(os.getenv("S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024) # S3 minimum is 5 MiB
+S3_MULTIPART_MAX_PENDING_PARTS = int(os.getenv("S3_MULTIPART_MAX_PENDING_PARTS", "2")) # parts buffered while uploading
+S3_PRESIGNED_URL_EXPIRY = int(os.getenv("S3_PRESIGNED_URL_EXPIRY", "900")) # seconds
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=S3_MAX_WORKERS, thread_name_prefix="s3")
+_client = None
+
+def get_s3_client():
+    """Returns the process-wide boto3 S3 client (boto3 clients are thread-safe)."""
+    global _client
+    if _client is None:
+        _client = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+            region_name=S3_REGION,
+            config=Config(max_pool_connections=S3_MAX_WORKERS * 2)
+        )
+        logger.info("Created shared S3 client.")
+    return _client
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking S3 call on the bounded storage executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+async def put_object(bucket: str, key: str, body, content_type: str | None = None):
+    extra = {"ContentType": content_type} if content_type else {}
+    return await run_blocking(get_s3_client().put_object, Bucket=bucket, Key=key, Body=body, **extra)
+
+async def upload_fileobj(fileobj, bucket: str, key: str, content_type: str | None = None):
+    """Uploads a file-like object; boto3 switches to a multipart upload for large bodies."""
+    extra = {"ExtraArgs": {"ContentType": content_type}} if content_type else {}
+    return await run_blocking(get_s3_client().upload_fileobj, fileobj, bucket, key, **extra)
+
+async def download_fileobj(bucket: str, key: str, fileobj):
+    return await run_blocking(get_s3_client().download_fileobj, bucket, key, fileobj)
+
+async def head_object(bucket: str, key: str) -> dict:
+    """Fetches an object's metadata; raises ClientError if it does not exist."""
+    return await run_blocking(get_s3_client().head_object, Bucket=bucket, Key=key)
+
+async def copy_object(source_bucket: str, source_key: str, bucket: str, key: str):
+    """Copies an object inside the store, without transferring its bytes through this process."""
+    return await run_blocking(get_s3_client().copy_object, CopySource={"Bucket": source_bucket, "Key": source_key}, Bucket=bucket, Key=key)
+
+async def delete_object(bucket: str, key: str):
+    return await run_blocking(get_s3_client().delete_object, Bucket=bucket, Key=key)
+
+def presigned_get_url(bucket: str, key: str, expires_in: int = S3_PRESIGNED_URL_EXPIRY) -> str:
+    """Signs a temporary GET URL, e.g. for decoders that read (and seek) over HTTP. Signing makes no request."""
+    return get_s3_client().generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expires_in)
+
+async def open_object(bucket: str, key: str) -> dict:
+    """Starts a GET on an object; the response carries 'ContentLength' and the unread 'Body'."""
+    return await run_blocking(get_s3_client().get_object, Bucket=bucket, Key=key)
+
+async def iter_body(body, chunk_size: int = S3_STREAM_CHUNK_SIZE):
+    """Reads an open object body chunk by chunk without buffering it in full."""
+    try:
+        while True:
+            chunk = await run_blocking(body.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        body.close()
+
+async def iter_object(bucket: str, key: str, chunk_size: int = S3_STREAM_CHUNK_SIZE):
+    """Streams an object's body chunk by chunk without buffering it in full."""
+    response = await open_object(bucket, key)
+    async for chunk in iter_body(response["Body"], chunk_size):
+        yield chunk
+
+async def upload_stream(chunks, bucket: str, key: str, content_type: str | None = None,
+                        part_size: int = S3_MULTIPART_PART_SIZE, max_pending_parts: int = S3_MULTIPART_MAX_PENDING_PARTS) -> int:
+    """
+    Uploads an async iterator of byte chunks as an S3 multipart upload.
+    Parts are uploaded while the next one is still being received, and at most
+    max_pending_parts are in flight, so memory stays bounded by the part size
+    regardless of the total length. Returns the number of bytes uploaded.
+    """
+    client = get_s3_client()
+    extra = {"ContentType": content_type} if content_type else {}
+    upload = await run_blocking(client.create_multipart_upload, Bucket=bucket, Key=key, **extra)
+    upload_id = upload["UploadId"]
+    slots = asyncio.Semaphore(max_pending_parts)
+    tasks: list[asyncio.Task] = []
+    buffer = bytearray()
+    total_bytes = 0
+
+    async def upload_part(part_number: int, body: bytes) -> dict:
+        try:
+            response = await run_blocking(client.upload_part, Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body)
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            slots.release()
+
+    async def flush(body: bytes):
+        await slots.acquire()
+        tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, body)))
+
+    try:
+        async for chunk in chunks:
+            buffer.extend(chunk)
+            total_bytes += len(chunk)
+            while len(buffer) >= part_size:
+                await flush(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+        if buffer or not tasks:
+            await flush(bytes(buffer))
+        parts = await asyncio.gather(*tasks)
+        await run_blocking(client.complete_multipart_upload, Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": list(parts)})
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await run_blocking(client.abort_multipart_upload, Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload for '{key}': {e}")
+        raise
+    logger.info(f"Streamed {total_bytes} bytes to '{bucket}/{key}' in {len(tasks)} parts.")
+    return total_bytes
@@ -1,25 +1,43 @@
 import os
 import uvicorn
 import logging
+import asyncio
+import hashlib
+import datetime
 import httpx
-import boto3
-from botocore.exceptions import ClientError
+from contextlib import asynccontextmanager
+from botocore.exceptions import BotoCoreError, ClientError
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from utils.db import get_db, Avatar, Interaction, Session as DbSession
+from utils.db import get_db, Avatar, AudioProvider, AudioSegment, Interaction, TtsCacheEntry, Session as DbSession
+from utils import storage
+from utils.http import get_http_client, close_http_client, get_http_stats, TIMEOUT_PROFILES
 
-S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
-S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
-S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "audio-outputs")
-S3_REGION = os.getenv("S3_REGION", "us-east-1")
+
+# Content-addressed cache of synthesized audio, so repeated texts skip the TTS provider
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_PREFIX = os.getenv("TTS_CACHE_PREFIX", "tts-cache")
+TTS_CACHE_MAX_AGE = int(os.getenv("TTS_CACHE_MAX_AGE", str(30 * 24 * 3600))) # seconds since last use
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))) # total size of cached audio
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_client()
+    yield
+    await close_http_client()
 
 app = FastAPI(
     title="Vocal Engine",
     description="Generates audio from text and stores it in an S3-compatible object store.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -32,98 +50,333 @@ class VocalResponse(BaseModel):
     interaction_id: int
     generated_audio_key: str = Field(..., description="The S3 key for the generated audio file.")
 
-def get_s3_client():
-    """Initializes and returns a boto3 S3 client."""
-    try:
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=S3_ENDPOINT_URL,
-            aws_access_key_id=S3_ACCESS_KEY_ID,
-            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
-            region_name=S3_REGION
-        )
-        return s3_client
-    except Exception as e:
-        logger.error(f"Failed to create S3 client: {e}")
-        return None
+class SegmentRequest(BaseModel):
+    interaction_id: int = Field(..., description="The ID of the interaction the segment belongs to.")
+    segment_index: int = Field(..., ge=0, description="Position of the segment within the response.")
+    text: str = Field(..., min_length=1, description="The sentence(s) to vocalize.")
 
-@app.post("/v1/synthesize", response_model=VocalResponse)
-async def synthesize_speech(request: VocalRequest, db: Session = Depends(get_db)):
+class SegmentResponse(BaseModel):
+    interaction_id: int
+    segment_index: int
+    audio_key: str = Field(..., description="The S3 key for the segment audio.")
+
+class LiveAudioStream:
     """
-    Takes an interaction_id, generates the corresponding audio, and uploads it to S3.
+    Audio chunks of a synthesis in progress. Subscribers that join late
+    first receive the chunks already produced, then follow along live.
+    If the synthesis fails, subscribers get an error instead of a normal end.
     """
-    logger.info(f"Received request to synthesize speech for interaction_id: {request.interaction_id}")
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.finished = False
+        self.failed = False
+        self._changed = asyncio.Condition()
 
-    # 1. Fetch Interaction and related Provider details
-    try:
-        interaction = db.query(Interaction).options(
-            joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.audio_provider)
-        ).filter(Interaction.interaction_id == request.interaction_id).first()
+    async def append(self, chunk: bytes):
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.finished = True
+            self._changed.notify_all()
+
+    async def abort(self):
+        async with self._changed:
+            self.finished = True
+            self.failed = True
+            self._changed.notify_all()
 
-        if not interaction or not interaction.session.avatar.audio_provider:
-            raise HTTPException(status_code=404, detail="Interaction or associated audio provider not found.")
-        
-        audio_provider = interaction.session.avatar.audio_provider
-        text_to_speak = interaction.agent_response_text
-        if not text_to_speak:
-            raise HTTPException(status_code=400, detail="No agent_response_text to synthesize.")
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.chunks) or self.finished)
+                new_chunks = self.chunks[position:]
+                finished = self.finished
+            position += len(new_chunks)
+            for chunk in new_chunks:
+                yield chunk
+            if finished and position >= len(self.chunks):
+                if self.failed:
+                    # Breaks the response, so listeners do not mistake the truncated audio for a complete file
+                    raise RuntimeError("Audio synthesis failed before the stream was complete.")
+                break
 
+# Syntheses currently running in this process, by interaction_id
+live_streams: dict[int, LiveAudioStream] = {}
+
+async def fetch_interaction(interaction_id: int, db: AsyncSession) -> Interaction:
+    """Loads an interaction together with its avatar's audio provider."""
+    try:
+        result = await db.execute(select(Interaction).options(
+            joinedload(Interaction.session).joinedload(DbSession.avatar).joinedload(Avatar.audio_provider)
+        ).where(Interaction.interaction_id == interaction_id))
+        interaction = result.scalars().first()
     except Exception as e:
-        logger.error(f"Database error for interaction {request.interaction_id}: {e}")
+        logger.error(f"Database error for interaction {interaction_id}: {e}")
         raise HTTPException(status_code=500, detail="Database error.")
+    if not interaction or not interaction.session.avatar.audio_provider:
+        raise HTTPException(status_code=404, detail="Interaction or associated audio provider not found.")
+    return interaction
 
-    # 2. Call the external TTS provider
+async def provider_audio(audio_provider: AudioProvider, text: str):
+    """Streams the MPEG audio for a text from the external TTS provider."""
     api_key = os.getenv(audio_provider.api_key_env_var) if audio_provider.api_key_env_var else None
     if not api_key:
         raise HTTPException(status_code=500, detail="TTS API key is not configured.")
 
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {"reference_id": audio_provider.provider_voice_id, "text": text_to_speak}
+    payload = {"reference_id": audio_provider.provider_voice_id, "text": text}
+
+    logger.info(f"Contacting TTS provider: {audio_provider.provider_endpoint}")
+    client = get_http_client()
+    async with client.stream("POST", audio_provider.provider_endpoint, headers=headers, json=payload, timeout=TIMEOUT_PROFILES["default"]) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            yield chunk
 
+async def stitched_segments(segments: list[AudioSegment]):
+    """Concatenates the segment files in order, dropping per-file ID3 headers."""
+    for segment in segments:
+        first_chunk = True
+        async for chunk in storage.iter_object(S3_BUCKET_NAME, segment.audio_url):
+            if first_chunk:
+                chunk = strip_id3_header(chunk)
+                first_chunk = False
+            yield chunk
+
+def strip_id3_header(chunk: bytes) -> bytes:
+    if len(chunk) >= 10 and chunk[:3] == b"ID3":
+        # ID3v2 size is a 28-bit "syncsafe" integer after the 10-byte header
+        size = (chunk[6] << 21) | (chunk[7] << 14) | (chunk[8] << 7) | chunk[9]
+        return chunk[10 + size:]
+    return chunk
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+async def stream_to_s3(chunks, s3_object_key: str, live_stream: LiveAudioStream | None = None) -> tuple[int, str]:
+    """
+    Uploads an audio stream to S3, forwarding every chunk to a live stream on the way.
+    Returns the size in bytes and the SHA-256 of the audio.
+    """
+    digest = hashlib.sha256()
+
+    async def tee(chunks):
+        async for chunk in chunks:
+            digest.update(chunk)
+            if live_stream:
+                await live_stream.append(chunk)
+            yield chunk
+
+    completed = False
     try:
-        logger.info(f"Contacting TTS provider: {audio_provider.provider_endpoint}")
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(audio_provider.provider_endpoint, headers=headers, json=payload)
-            response.raise_for_status()
-            audio_content = response.content
-    except Exception as e:
+        size_bytes = await storage.upload_stream(tee(chunks), S3_BUCKET_NAME, s3_object_key, content_type='audio/mpeg')
+        completed = True
+        logger.info(f"Successfully uploaded audio to S3 bucket '{S3_BUCKET_NAME}' with key '{s3_object_key}'")
+        return size_bytes, digest.hexdigest()
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         logger.error(f"Error calling TTS API: {e}")
         raise HTTPException(status_code=502, detail="Error from external TTS provider.")
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Failed to upload audio to S3: {e}")
+        raise HTTPException(status_code=500, detail="Could not upload generated audio.")
+    except Exception as e:
+        logger.error(f"Audio streaming to S3 failed for key '{s3_object_key}': {e}")
+        raise HTTPException(status_code=500, detail="Could not stream generated audio.")
+    finally:
+        if live_stream:
+            await (live_stream.finish() if completed else live_stream.abort())
+
+def tts_cache_key(audio_provider: AudioProvider, text: str) -> str:
+    return hashlib.sha256(f"{audio_provider.provider_endpoint}\n{audio_provider.provider_voice_id}\n{normalize_text(text)}".encode()).hexdigest()
 
-    # 3. Upload the generated audio to S3
-    s3_client = get_s3_client()
-    if not s3_client:
-        raise HTTPException(status_code=500, detail="S3 client not available.")
+async def copy_cached_audio(cache_key: str, s3_object_key: str, db: AsyncSession) -> TtsCacheEntry | None:
+    """Copies cached audio to the given key. Returns None on a cache miss."""
+    entry = await db.get(TtsCacheEntry, cache_key)
+    if not entry:
+        return None
+    try:
+        await storage.copy_object(S3_BUCKET_NAME, entry.s3_key, S3_BUCKET_NAME, s3_object_key)
+        entry.hits += 1
+        entry.last_used_at = datetime.datetime.utcnow()
+        await db.commit()
+        logger.info(f"TTS cache hit, copied '{entry.s3_key}' to '{s3_object_key}'.")
+        return entry
+    except ClientError as e:
+        logger.warning(f"Cached audio '{entry.s3_key}' is unavailable, dropping the entry: {e}")
+        await db.delete(entry)
+        await db.commit()
+        return None
+
+async def cache_audio(cache_key: str, audio_provider: AudioProvider, s3_object_key: str, size_bytes: int, audio_sha256: str, db: AsyncSession):
+    """Keeps a copy of freshly synthesized audio under its content address. Failures only cost the cache entry."""
+    cache_object_key = f"{TTS_CACHE_PREFIX}/{cache_key}.mp3"
+    try:
+        await storage.copy_object(S3_BUCKET_NAME, s3_object_key, S3_BUCKET_NAME, cache_object_key)
+        await db.execute(insert(TtsCacheEntry).values(
+            cache_key=cache_key, provider_endpoint=audio_provider.provider_endpoint, provider_voice_id=audio_provider.provider_voice_id,
+            s3_key=cache_object_key, size_bytes=size_bytes, audio_sha256=audio_sha256
+        ).on_conflict_do_nothing(index_elements=["cache_key"]))
+        await db.commit()
+        await evict_tts_cache(db)
+    except Exception as e:
+        logger.warning(f"Failed to cache audio '{s3_object_key}': {e}")
+        await db.rollback()
+
+async def evict_tts_cache(db: AsyncSession):
+    """Removes entries unused for TTS_CACHE_MAX_AGE, then the least recently used ones above TTS_CACHE_MAX_BYTES."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=TTS_CACHE_MAX_AGE)
+    result = await db.execute(select(TtsCacheEntry).where(TtsCacheEntry.last_used_at < cutoff))
+    evicted = list(result.scalars().all())
+
+    total_bytes = await db.scalar(select(func.coalesce(func.sum(TtsCacheEntry.size_bytes), 0)).where(TtsCacheEntry.last_used_at >= cutoff))
+    if total_bytes > TTS_CACHE_MAX_BYTES:
+        result = await db.execute(select(TtsCacheEntry).where(TtsCacheEntry.last_used_at >= cutoff).order_by(TtsCacheEntry.last_used_at.asc()))
+        for entry in result.scalars():
+            if total_bytes <= TTS_CACHE_MAX_BYTES:
+                break
+            evicted.append(entry)
+            total_bytes -= entry.size_bytes
+
+    for entry in evicted:
+        await storage.delete_object(S3_BUCKET_NAME, entry.s3_key)
+        await db.delete(entry)
+    if evicted:
+        await db.commit()
+        logger.info(f"Evicted {len(evicted)} TTS cache entries.")
+
+@app.post("/v1/synthesize", response_model=VocalResponse)
+async def synthesize_speech(request: VocalRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Takes an interaction_id, generates the corresponding audio, and streams it to S3.
+    Texts synthesized before with the same voice are copied from the TTS cache. If the
+    conversational service already had the response synthesized sentence by sentence,
+    the segments are stitched in order instead of calling the provider again.
+    """
+    logger.info(f"Received request to synthesize speech for interaction_id: {request.interaction_id}")
+
+    # 1. Fetch Interaction and related Provider details
+    interaction = await fetch_interaction(request.interaction_id, db)
+    audio_provider = interaction.session.avatar.audio_provider
+    text_to_speak = interaction.agent_response_text
+    if not text_to_speak:
+        raise HTTPException(status_code=400, detail="No agent_response_text to synthesize.")
 
     # Use a .mp3 extension as the provider returns MPEG audio
     s3_object_key = f"interaction_{request.interaction_id}.mp3"
-    
+    cache_key = tts_cache_key(audio_provider, text_to_speak)
+    cache_entry = await copy_cached_audio(cache_key, s3_object_key, db) if TTS_CACHE_ENABLED else None
+    if cache_entry:
+        return await save_audio_key(interaction, s3_object_key, cache_entry.audio_sha256, db)
+
+    result = await db.execute(select(AudioSegment).where(AudioSegment.interaction_id == request.interaction_id).order_by(AudioSegment.segment_index.asc()))
+    segments = result.scalars().all()
+    use_segments = bool(segments) and normalize_text(" ".join(segment.segment_text for segment in segments)) == normalize_text(text_to_speak)
+    if segments and not use_segments:
+        logger.warning(f"Audio segments of interaction {request.interaction_id} do not cover the final text, synthesizing in full.")
+    # End the read transaction, so no pooled connection sits idle while the audio streams
+    await db.commit()
+
+    # 2. Stream the audio into S3 (and to live listeners) as it arrives
+    live_stream = LiveAudioStream()
+    live_streams[request.interaction_id] = live_stream
     try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_object_key,
-            Body=audio_content,
-            ContentType='audio/mpeg' # Set correct content type for MP3
-        )
-        logger.info(f"Successfully uploaded audio to S3 bucket '{S3_BUCKET_NAME}' with key '{s3_object_key}'")
-    except ClientError as e:
-        logger.error(f"Failed to upload audio to S3: {e}")
-        raise HTTPException(status_code=500, detail="Could not upload generated audio.")
+        if use_segments:
+            logger.info(f"Stitching {len(segments)} pre-synthesized segments for interaction {request.interaction_id}.")
+            size_bytes, audio_sha256 = await stream_to_s3(stitched_segments(segments), s3_object_key, live_stream)
+        else:
+            size_bytes, audio_sha256 = await stream_to_s3(provider_audio(audio_provider, text_to_speak), s3_object_key, live_stream)
+
+        # 3. Update the Interaction record in the database
+        response = await save_audio_key(interaction, s3_object_key, audio_sha256, db)
+    finally:
+        # Late listeners are served from S3 from now on; a newer synthesis of the same interaction keeps its entry
+        if live_streams.get(request.interaction_id) is live_stream:
+            del live_streams[request.interaction_id]
 
-    # 4. Update the Interaction record in the database
+    if TTS_CACHE_ENABLED:
+        await cache_audio(cache_key, audio_provider, s3_object_key, size_bytes, audio_sha256, db)
+    return response
+
+async def save_audio_key(interaction: Interaction, s3_object_key: str, audio_sha256: str | None, db: AsyncSession) -> VocalResponse:
     try:
         interaction.generated_audio_url = s3_object_key
-        db.commit()
-        logger.info(f"Updated interaction {request.interaction_id} with S3 key.")
+        interaction.generated_audio_sha256 = audio_sha256
+        await db.commit()
+        logger.info(f"Updated interaction {interaction.interaction_id} with S3 key.")
     except Exception as e:
         logger.error(f"Failed to update interaction record: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Failed to update database with S3 key.")
 
     return VocalResponse(
-        interaction_id=request.interaction_id,
+        interaction_id=interaction.interaction_id,
         generated_audio_key=s3_object_key,
     )
 
+@app.post("/v1/synthesize-segment", response_model=SegmentResponse)
+async def synthesize_segment(request: SegmentRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Synthesizes one sentence-level segment of a response while the rest of the
+    text is still being generated. Segments are stored in S3 and recorded in the
+    database, so any replica can stitch them in /v1/synthesize.
+    """
+    logger.info(f"Received segment {request.segment_index} for interaction_id: {request.interaction_id}")
+    interaction = await fetch_interaction(request.interaction_id, db)
+    audio_provider = interaction.session.avatar.audio_provider
+
+    s3_object_key = f"interaction_{request.interaction_id}/segment_{request.segment_index:03d}.mp3"
+    cache_key = tts_cache_key(audio_provider, request.text)
+    if not (TTS_CACHE_ENABLED and await copy_cached_audio(cache_key, s3_object_key, db)):
+        await db.commit() # ends the read transaction before the provider call
+        size_bytes, audio_sha256 = await stream_to_s3(provider_audio(audio_provider, request.text), s3_object_key)
+        if TTS_CACHE_ENABLED:
+            await cache_audio(cache_key, audio_provider, s3_object_key, size_bytes, audio_sha256, db)
+
+    try:
+        result = await db.execute(select(AudioSegment).where(
+            AudioSegment.interaction_id == request.interaction_id, AudioSegment.segment_index == request.segment_index
+        ))
+        segment = result.scalars().first()
+        if not segment:
+            segment = AudioSegment(interaction_id=request.interaction_id, segment_index=request.segment_index)
+            db.add(segment)
+        segment.segment_text = request.text
+        segment.audio_url = s3_object_key
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to record audio segment: {e}")
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Failed to record audio segment.")
+
+    return SegmentResponse(interaction_id=request.interaction_id, segment_index=request.segment_index, audio_key=s3_object_key)
+
+@app.get("/v1/stream/{interaction_id}")
+async def stream_speech(interaction_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Streams the synthesized audio of an interaction. While synthesis is still
+    running in this process, chunks are forwarded as soon as the provider
+    delivers them; afterwards, the stored file is streamed from S3.
+    """
+    live_stream = live_streams.get(interaction_id)
+    if live_stream:
+        return StreamingResponse(live_stream.subscribe(), media_type="audio/mpeg")
+
+    interaction = await db.get(Interaction, interaction_id)
+    await db.commit() # the session is only closed after the response, so end the transaction before streaming
+    if not interaction or not interaction.generated_audio_url:
+        raise HTTPException(status_code=404, detail="No audio available for this interaction.")
+    return StreamingResponse(storage.iter_object(S3_BUCKET_NAME, interaction.generated_audio_url), media_type="audio/mpeg")
+
+@app.get("/v1/stats/http")
+async def http_stats():
+    """Returns connection pool statistics of the shared HTTP client."""
+    return get_http_stats()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)